@@ -0,0 +1,331 @@
+"""离线基准测试：在本地模拟 paperswithcode 列表页/详情页、arXiv PDF 和 GitHub 仓库，运行 main.py 并报告吞吐量
+
+用法示例：
+    python benchmark.py --papers 200 --pdf-kb 512 --latency-ms 50
+    python benchmark.py --papers 200 --runs 3 --report bench.jsonl --engine pipeline --concurrency 8
+
+未识别的参数原样传给 main.py，便于比较不同的引擎、并发数、缓存和连接池设置。
+"""
+import os
+import sys
+import time
+import json
+import random
+import shutil
+import argparse
+import tempfile
+import resource
+import sqlite3
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+TASK_PATH = "/task/benchmark"
+# 每个请求类别的计数和发出的字节数
+REQUEST_KINDS = ('listing', 'detail', 'pdf', 'archive', 'other')
+CODELOAD_PATH = "/codeload/"
+
+class BenchmarkServer:
+    """在后台线程中运行的本地 HTTP 服务器，模拟列表页、详情页和 PDF
+
+    列表页每页 per_page 篇论文，详情页给出本地 PDF 链接和 file:// 仓库地址，
+    PDF 内容按论文编号固定生成，支持 Range 请求；每个请求先等待 latency 秒，
+    bandwidth 大于 0 时每个连接发送PDF的速率限制为 bandwidth 字节/秒，用于模拟慢速镜像。
+    codeload 为真时详情页给出 https://github.com/... 仓库地址，并在 /codeload/ 下用 git archive
+    提供与 codeload.github.com 格式相同的 tar.gz 归档（顶层目录为 <name>-HEAD/）。
+    """
+
+    def __init__(self, papers, per_page, pdf_bytes, latency, repo_urls, bandwidth=0, codeload=False):
+        self.papers = papers
+        self.per_page = per_page
+        self.pdf_bytes = pdf_bytes
+        self.latency = latency
+        self.repo_urls = repo_urls
+        self.bandwidth = bandwidth
+        self.codeload = codeload
+        self.archive_cache = {}
+        self.lock = threading.Lock()
+        self.counts = dict.fromkeys(REQUEST_KINDS, 0)
+        self.bytes_sent = 0
+        self.pdf_cache = {}
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_counters(self):
+        with self.lock:
+            self.counts = dict.fromkeys(REQUEST_KINDS, 0)
+            self.bytes_sent = 0
+
+    def count(self, kind, nbytes):
+        with self.lock:
+            self.counts[kind] += 1
+            self.bytes_sent += nbytes
+
+    def listing_page(self, page):
+        cards = []
+        first = (page - 1) * self.per_page
+        for k in range(first, min(first + self.per_page, self.papers)):
+            cards.append(
+                f'<div class="row infinite-item item paper-card">'
+                f'<h1><a href="/paper/bench-paper-{k}">Benchmark Paper {k}</a></h1>'
+                f'<span class="author-name-text item-date-pub">{k % 28 + 1} Jan 2023</span>'
+                f'<div class="entity-stars"><span class="badge">{k * 7 % 5000}</span></div>'
+                f'<a href="/paper/bench-paper-{k}#code" class="badge badge-dark">Code</a></div>')
+        return f"<html><body>{''.join(cards)}</body></html>".encode()
+
+    def detail_page(self, k):
+        repo = self.repo_urls[k % len(self.repo_urls)] if self.repo_urls else ''
+        if repo and self.codeload:
+            repo = "https://github.com/" + repo.split('github.com/', 1)[1][:-len('.git')]
+        return (f'<html><body><h1>Benchmark Paper {k}</h1>'
+                f'<a href="{self.url}/pdf/{k}.pdf">PDF</a>'
+                f'<a href="{repo}">github.com code</a></body></html>').encode()
+
+    def pdf(self, k):
+        with self.lock:
+            data = self.pdf_cache.get(k)
+        if data is None:
+            data = b'%PDF-1.4\n' + random.Random(k).randbytes(max(0, self.pdf_bytes - 9))
+            with self.lock:
+                self.pdf_cache[k] = data
+        return data
+
+    def archive(self, repo):
+        """owner/name 仓库 HEAD 的 tar.gz 归档，仓库不存在时返回 None"""
+        with self.lock:
+            data = self.archive_cache.get(repo)
+        if data is None:
+            bare = next((url[len('file://'):] for url in self.repo_urls if url.endswith(f"/{repo}.git")), None)
+            if bare is None:
+                return None
+            name = repo.split('/')[-1]
+            data = subprocess.run(['git', 'archive', '--format=tar.gz', f'--prefix={name}-HEAD/', 'HEAD'],
+                                  cwd=bare, capture_output=True, check=True).stdout
+            with self.lock:
+                self.archive_cache[repo] = data
+        return data
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def send_body(self, kind, body, content_type, status=200, headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if kind == 'pdf' and server.bandwidth:
+                    step = max(1, server.bandwidth // 20)
+                    for start in range(0, len(body), step):
+                        self.wfile.write(body[start:start + step])
+                        time.sleep(len(body[start:start + step]) / server.bandwidth)
+                else:
+                    self.wfile.write(body)
+                server.count(kind, len(body))
+
+            def do_GET(self):
+                time.sleep(server.latency)
+                path, _, query = self.path.partition('?')
+                if path == TASK_PATH:
+                    page = int(query.split('page=')[1]) if 'page=' in query else 1
+                    self.send_body('listing', server.listing_page(page), 'text/html')
+                elif path.startswith('/paper/bench-paper-'):
+                    self.send_body('detail', server.detail_page(int(path.rsplit('-', 1)[1])), 'text/html')
+                elif path.startswith('/pdf/') and path.endswith('.pdf'):
+                    self.send_pdf(int(path[len('/pdf/'):-len('.pdf')]))
+                elif path.startswith(CODELOAD_PATH) and path.endswith('/tar.gz/HEAD'):
+                    data = server.archive(path[len(CODELOAD_PATH):-len('/tar.gz/HEAD')])
+                    if data is None:
+                        self.send_body('archive', b'not found', 'text/plain', status=404)
+                    else:
+                        self.send_body('archive', data, 'application/x-gzip')
+                else:
+                    self.send_body('other', b'not found', 'text/plain', status=404)
+
+            def send_pdf(self, k):
+                data = server.pdf(k)
+                byte_range = self.headers.get('Range', '')
+                if byte_range.startswith('bytes='):
+                    start_text, _, end_text = byte_range[len('bytes='):].partition('-')
+                    start = int(start_text or 0)
+                    end = min(int(end_text), len(data) - 1) if end_text else len(data) - 1
+                    if start >= len(data):
+                        self.send_body('pdf', b'', 'application/pdf', status=416,
+                                       headers={'Content-Range': f'bytes */{len(data)}'})
+                        return
+                    self.send_body('pdf', data[start:end + 1], 'application/pdf', status=206,
+                                   headers={'Content-Range': f'bytes {start}-{end}/{len(data)}',
+                                            'Accept-Ranges': 'bytes'})
+                else:
+                    self.send_body('pdf', data, 'application/pdf', headers={'Accept-Ranges': 'bytes'})
+
+        return Handler
+
+def create_bare_repos(root, count, size_bytes, files=8):
+    """创建 count 个本地裸仓库，每个包含总计约 size_bytes 的随机内容文件，返回 file:// 地址列表
+
+    路径中包含 github.com，使其能被详情页解析逻辑识别为代码仓库链接。
+    """
+    urls = []
+    env = dict(os.environ, GIT_AUTHOR_NAME='bench', GIT_AUTHOR_EMAIL='bench@localhost',
+               GIT_COMMITTER_NAME='bench', GIT_COMMITTER_EMAIL='bench@localhost')
+    for i in range(count):
+        work = os.path.join(root, 'work', f'repo{i}')
+        bare = os.path.join(root, 'github.com', 'bench', f'repo{i}.git')
+        os.makedirs(os.path.join(work, 'src'), exist_ok=True)
+        rng = random.Random(i)
+        for j in range(files):
+            with open(os.path.join(work, 'src', f'module{j}.py'), 'wb') as f:
+                f.write(rng.randbytes(size_bytes // files))
+        with open(os.path.join(work, 'README.md'), 'w') as f:
+            f.write(f"# benchmark repo {i}\n")
+        subprocess.run(['git', 'init', '-q', work], check=True)
+        subprocess.run(['git', 'add', '-A'], cwd=work, check=True)
+        subprocess.run(['git', 'commit', '-q', '-m', 'init'], cwd=work, check=True, env=env)
+        subprocess.run(['git', 'clone', '-q', '--bare', work, bare], check=True)
+        subprocess.run(['git', 'config', 'uploadpack.allowFilter', 'true'], cwd=bare, check=True)
+        shutil.rmtree(work)
+        urls.append('file://' + bare)
+    return urls
+
+def watch_peak_rss(pid, result, interval=0.05):
+    """轮询 /proc/<pid>/status 中的 VmHWM，记录进程的峰值常驻内存（KB）"""
+    status_path = f"/proc/{pid}/status"
+    while True:
+        try:
+            with open(status_path) as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        result['peak_rss_kb'] = max(result.get('peak_rss_kb', 0), int(line.split()[1]))
+        except (OSError, ValueError):
+            return
+        time.sleep(interval)
+
+def completed_papers(state_db):
+    """从状态库读取已完成的论文数和已克隆的仓库数"""
+    if not os.path.exists(state_db):
+        return 0, 0
+    conn = sqlite3.connect(state_db)
+    try:
+        done = conn.execute("SELECT COUNT(*) FROM papers WHERE pdf_status IN ('done', 'missing') "
+                            "AND code_status IN ('done', 'missing')").fetchone()[0]
+        clones = conn.execute("SELECT COUNT(*) FROM papers WHERE code_status = 'done'").fetchone()[0]
+    finally:
+        conn.close()
+    return done, clones
+
+def run_crawl(server, output_dir, main_args, verbose=False):
+    """运行一次 main.py 抓取，返回耗时、峰值内存、请求计数等结果"""
+    server.reset_counters()
+    cmd = [sys.executable, MAIN_SCRIPT, '--no-proxy', '--base-url', server.url + TASK_PATH,
+           '--output-dir', output_dir] + main_args
+    rss = {}
+    start = time.monotonic()
+    process = subprocess.Popen(cmd, stdout=None if verbose else subprocess.DEVNULL,
+                               stderr=None if verbose else subprocess.DEVNULL)
+    watcher = threading.Thread(target=watch_peak_rss, args=(process.pid, rss), daemon=True)
+    watcher.start()
+    returncode = process.wait()
+    elapsed = time.monotonic() - start
+    watcher.join(timeout=1)
+
+    papers, clones = completed_papers(os.path.join(output_dir, "crawl_state.sqlite3"))
+    peak_rss_kb = rss.get('peak_rss_kb') or resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    with server.lock:
+        counts = dict(server.counts)
+        bytes_sent = server.bytes_sent
+    return {
+        'returncode': returncode,
+        'seconds': round(elapsed, 3),
+        'papers': papers,
+        'clones': clones,
+        'papers_per_sec': round(papers / elapsed, 2) if elapsed else 0.0,
+        'bytes': bytes_sent,
+        'bytes_per_sec': round(bytes_sent / elapsed, 1) if elapsed else 0.0,
+        'peak_rss_mb': round(peak_rss_kb / 1024, 1),
+        'requests': counts,
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Offline benchmark for main.py against a local paperswithcode stand-in; "
+                    "unrecognised arguments are passed to main.py")
+    parser.add_argument('--papers', type=int, default=100, help="模拟的论文数量")
+    parser.add_argument('--per-page', type=int, default=10, help="每个列表页的论文数量")
+    parser.add_argument('--pdf-kb', type=int, default=256, help="每个PDF的大小（KB）")
+    parser.add_argument('--latency-ms', type=float, default=20, help="每个HTTP请求的服务端延迟（毫秒）")
+    parser.add_argument('--pdf-kbps', type=int, default=0, help="每个连接发送PDF的速率上限（KB/s），0 表示不限")
+    parser.add_argument('--repos', type=int, default=10, help="本地裸仓库数量，论文按编号轮流使用")
+    parser.add_argument('--repo-kb', type=int, default=256, help="每个仓库的内容大小（KB）")
+    parser.add_argument('--codeload', action='store_true',
+                        help="本地提供 codeload 风格的代码归档并以 --code-backend tarball 运行 main.py")
+    parser.add_argument('--runs', type=int, default=1, help="重复运行次数，每次使用新的下载目录")
+    parser.add_argument('--warm', action='store_true',
+                        help="重复运行时保留下载目录和状态库，测量重启/增量场景")
+    parser.add_argument('--report', default=None, metavar='PATH', help="把每次运行的结果追加为 JSON Lines")
+    parser.add_argument('--keep', action='store_true', help="保留临时目录（仓库和下载结果）")
+    parser.add_argument('--verbose', action='store_true', help="显示 main.py 的输出")
+    return parser.parse_known_args()
+
+def main():
+    args, main_args = parse_args()
+    if '--no-rate-limit' not in main_args and not any(arg.startswith('--rate') for arg in main_args):
+        # 本地服务器不需要限速，否则测到的是限速器的速率
+        main_args.append('--no-rate-limit')
+
+    root = tempfile.mkdtemp(prefix='pwc-bench-')
+    print(f"Preparing {args.repos} repositories of {args.repo_kb} KB in {root}")
+    repo_urls = create_bare_repos(root, args.repos, args.repo_kb * 1024)
+    server = BenchmarkServer(args.papers, args.per_page, args.pdf_kb * 1024, args.latency_ms / 1000,
+                             repo_urls, args.pdf_kbps * 1024, args.codeload).start()
+    if args.codeload:
+        # 仓库地址是 github.com 形式，归档必须来自本地服务器，不能回退到真实的 git clone
+        main_args += ['--code-backend', 'tarball',
+                      '--codeload-url', server.url + CODELOAD_PATH + '{repo}/tar.gz/HEAD']
+    config = {
+        'papers': args.papers, 'per_page': args.per_page, 'pdf_kb': args.pdf_kb, 'latency_ms': args.latency_ms,
+        'pdf_kbps': args.pdf_kbps, 'codeload': args.codeload,
+        'repos': args.repos, 'repo_kb': args.repo_kb, 'main_args': main_args,
+    }
+    print(f"Serving {args.papers} papers at {server.url}{TASK_PATH}, main.py args: {' '.join(main_args)}")
+
+    try:
+        for run in range(1, args.runs + 1):
+            output_dir = os.path.join(root, 'out' if args.warm else f'out{run}')
+            result = run_crawl(server, output_dir, main_args, args.verbose)
+            requests_text = ' '.join(f"{kind}={count}" for kind, count in result['requests'].items())
+            print(f"Run {run}: {result['papers']} papers in {result['seconds']}s "
+                  f"({result['papers_per_sec']} papers/s), {result['clones']} clones, "
+                  f"{result['bytes'] / (1024 * 1024):.1f} MB at {result['bytes_per_sec'] / (1024 * 1024):.2f} MB/s, "
+                  f"peak RSS {result['peak_rss_mb']} MB, requests: {requests_text}"
+                  + (f", exit code {result['returncode']}" if result['returncode'] else ''))
+            if args.report:
+                with open(args.report, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(dict(config, run=run, timestamp=time.time(), **result)) + '\n')
+    finally:
+        server.stop()
+        if args.keep:
+            print(f"Kept benchmark files in {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@
 # -*-coding:utf-8-*-
 import os
 import subprocess
+import sys
 import requests
 from lxml import etree
 from tqdm import tqdm
@@ -12,9 +13,123 @@ import re
 import hashlib
 import urllib3
 import shutil
+import asyncio
+import sqlite3
+import threading
+from queue import Queue, Empty
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import argparse
+import socket
+import json
+import zlib
+import tarfile
+import gzip
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin, urlparse
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
 
 BASE_URL = "https://paperswithcode.com/task/time-series-anomaly-detection"
 BASE_DOWNLOAD_DIR = "paper-download_TimeSeriesAnomaly"
+# 多任务模式下按任务名拼接列表页地址
+TASK_URL_TEMPLATE = "https://paperswithcode.com/task/{slug}"
+# 多任务模式下在 tasks/<任务名>/ 中为每篇论文创建指向共享论文目录的符号链接
+LINK_TASK_FOLDERS = False
+MAX_PAGES = 200
+# 列表页预取窗口：处理当前页时最多提前请求的页数
+LISTING_PREFETCH = 8
+# 抓取状态数据库文件名（位于下载目录中）
+STATE_DB_NAME = "crawl_state.sqlite3"
+
+# HTTP响应缓存：目录名、按URL类别的有效期（秒）和总大小上限
+CACHE_DIR_NAME = ".http_cache"
+CACHE_TTL = {
+    'listing': 3600,
+    'detail': 30 * 24 * 3600,
+}
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# 按主机的初始请求速率（次/秒），子域名按后缀匹配；其他主机使用 DEFAULT_RATE
+HOST_RATES = {
+    'paperswithcode.com': 1.0,
+    'arxiv.org': 2.0,
+    'github.com': 2.0,
+}
+DEFAULT_RATE = 5.0
+# 速率自适应的上下限、限流时的降速倍数、连续成功多少次后提速
+MIN_RATE = 0.05
+MAX_RATE = 20.0
+BACKOFF_FACTOR = 0.5
+RAMP_UP_FACTOR = 1.1
+RAMP_UP_AFTER = 10
+# 遇到 429/503 时由限速器等待后重发的次数
+THROTTLE_STATUSES = (429, 503)
+THROTTLE_RETRIES = 3
+
+# PDF下载客户端每个主机的最大连接数
+DOWNLOAD_CONNECTIONS_PER_HOST = 10
+# 每次从连接读取的字节数和写入文件的缓冲区大小
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+WRITE_BUFFER_SIZE = 1024 * 1024
+# 超过该大小且服务器支持 Range 的文件分段下载，每个文件最多 DOWNLOAD_SEGMENTS 个并发连接
+SEGMENTED_THRESHOLD = 8 * 1024 * 1024
+DOWNLOAD_SEGMENTS = 4
+
+# 部分克隆选项：--filter 参数（如 blob:none、blob:limit=1m）和稀疏检出的路径模式
+CLONE_FILTER = None
+CLONE_SPARSE_PATHS = None
+# --sparse 使用的默认模式：只检出源码和文档
+SOURCE_SPARSE_PATTERNS = [
+    '*.py', '*.ipynb', '*.c', '*.cc', '*.cpp', '*.h', '*.hpp', '*.cu', '*.java', '*.jl', '*.m', '*.r', '*.R',
+    '*.sh', '*.md', '*.rst', '*.txt', '*.yaml', '*.yml', '*.json', '*.toml', '*.cfg', '*.ini',
+    'Makefile', 'Dockerfile', 'LICENSE*',
+]
+
+# 代码获取方式：git（git clone）或 tarball（下载默认分支的 codeload 归档，失败时回退到 git clone）
+CODE_BACKEND = 'git'
+CODELOAD_URL = "https://codeload.github.com/{repo}/tar.gz/HEAD"
+# 由列表页卡片上的 arXiv 编号直接生成PDF链接
+ARXIV_PDF_URL = "https://arxiv.org/pdf/{arxiv_id}"
+# arXiv PDF 的候选镜像，按顺序尝试；首个响应在 HEDGE_DELAY 秒内未到达时向下一个镜像发出对冲请求（0 表示只在失败时切换）
+ARXIV_MIRRORS = ["https://arxiv.org", "https://export.arxiv.org"]
+HEDGE_DELAY = 2.0
+
+# 共享的裸仓库镜像缓存：同一仓库只从网络克隆一次，各论文目录是镜像的 worktree，共享对象
+USE_GIT_MIRRORS = False
+GIT_MIRROR_DIR = None
+
+# 内容寻址存储目录，按SHA-256保存唯一的文件内容；为 None 时位于下载目录下的 .objects
+OBJECT_STORE_DIR = None
+
+# 异步抓取时每个主机允许的最大并发请求数
+DEFAULT_CONCURRENCY = 4
+
+# 流水线各阶段的默认工作者数量和队列长度
+DETAIL_WORKERS = 8
+PDF_WORKERS = 4
+CLONE_WORKERS = 2
+QUEUE_SIZE = 64
+# 克隆任务只是 (URL, 路径) 元组，队列可以更长，避免慢克隆反压到PDF下载
+CLONE_QUEUE_SIZE = 1024
+REPORT_INTERVAL = 10
+
+# 失败重试队列：第 n 次失败后等待 RETRY_BASE_DELAY * 2^(n-1) 秒（不超过 RETRY_MAX_DELAY），
+# 失败 RETRY_MAX_ATTEMPTS 次后移入死信列表，不再自动重试
+RETRY_BASE_DELAY = 300
+RETRY_MAX_DELAY = 24 * 3600
+RETRY_MAX_ATTEMPTS = 5
+
+# 分布式抓取：一致性哈希环上每个分片的虚拟节点数、工作租约时长和空闲时的轮询间隔
+SHARD_VNODES = 64
+LEASE_SECONDS = 1800
+QUEUE_POLL_INTERVAL = 10
+
+# 各阶段耗时直方图的桶上界（秒）和指标文件的写出间隔
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+METRICS_INTERVAL = 30
 
 # 代理设置
 proxies = {
@@ -35,14 +150,451 @@ proxy_session.headers.update({
 })
 proxy_session.proxies.update(proxies)
 
-def create_session(use_proxy=True):
+def parse_retry_after(value):
+    """解析 Retry-After 头（秒数或HTTP日期），返回需要等待的秒数"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def error_class(exc):
+    """把异常归类为简短的错误类别：HTTP状态码、git 错误或异常类型名"""
+    response = getattr(exc, 'response', None)
+    if getattr(response, 'status_code', None):
+        return f"HTTP{response.status_code}"
+    message = str(exc)
+    match = re.match(r'HTTP (\d{3})', message) or re.search(r'too many (\d{3}) error responses', message)
+    if match:
+        return f"HTTP{match.group(1)}"
+    if type(exc) is Exception and ('fatal:' in message or message.startswith('error:')):
+        return "GitError"
+    return type(exc).__name__
+
+class CrawlMetrics:
+    """按 (阶段, 主机) 统计耗时直方图、传输字节数、重试次数和错误类别
+    
+    阶段包括 listing、detail、parse、download、clone、下载请求的首字节时间 first_byte
+    以及限速器中的等待 rate_wait（请求阶段的耗时包含其中的限速等待）。
+    可以定期写出为 JSON 或 Prometheus 文本格式（文件名以 .prom 结尾时），结束时打印汇总。
+    """
+    
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.series = {}
+        self.started = time.time()
+        self.local = threading.local()
+        self.flusher = None
+        self.stop_event = threading.Event()
+    
+    def observe(self, stage, url, seconds, nbytes=0, retries=0, error=None):
+        parsed = urlparse(url)
+        host = parsed.hostname or parsed.scheme or url
+        with self.lock:
+            entry = self.series.get((stage, host))
+            if entry is None:
+                entry = self.series[(stage, host)] = {
+                    'count': 0, 'seconds': 0.0, 'max': 0.0, 'bytes': 0, 'retries': 0,
+                    'errors': {}, 'buckets': [0] * (len(self.buckets) + 1),
+                }
+            entry['count'] += 1
+            entry['seconds'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            entry['bytes'] += nbytes
+            entry['retries'] += retries
+            if error:
+                entry['errors'][error] = entry['errors'].get(error, 0) + 1
+            index = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+            entry['buckets'][index] += 1
+    
+    @contextmanager
+    def measure(self, stage, url):
+        """记录一次操作；调用方可以在返回的字典中累加 bytes、retries 或设置 error"""
+        sample = {'bytes': 0, 'retries': 0, 'error': None}
+        parent = getattr(self.local, 'sample', None)
+        self.local.sample = sample
+        start = time.monotonic()
+        try:
+            yield sample
+        except Exception as e:
+            sample['error'] = sample['error'] or error_class(e)
+            raise
+        finally:
+            self.local.sample = parent
+            self.observe(stage, url, time.monotonic() - start, sample['bytes'], sample['retries'], sample['error'])
+    
+    def note_retry(self):
+        """为当前线程正在测量的操作记一次重试（如被限流后重发）"""
+        sample = getattr(self.local, 'sample', None)
+        if sample is not None:
+            sample['retries'] += 1
+    
+    def _quantile(self, entry, q):
+        """由直方图估计分位数，取所在桶的上界"""
+        target = q * entry['count']
+        seen = 0
+        for bound, count in zip(self.buckets, entry['buckets']):
+            seen += count
+            if seen >= target:
+                return round(min(bound, entry['max']), 3)
+        return round(entry['max'], 3)
+    
+    def snapshot(self):
+        """当前全部指标，可直接序列化为 JSON"""
+        with self.lock:
+            series = []
+            for (stage, host), entry in sorted(self.series.items()):
+                series.append({
+                    'stage': stage, 'host': host, 'count': entry['count'],
+                    'seconds_sum': round(entry['seconds'], 6), 'max': round(entry['max'], 6),
+                    'p50': self._quantile(entry, 0.5), 'p95': self._quantile(entry, 0.95),
+                    'bytes': entry['bytes'],
+                    'bytes_per_second': round(entry['bytes'] / entry['seconds'], 1) if entry['seconds'] else 0.0,
+                    'retries': entry['retries'], 'errors': dict(entry['errors']),
+                    'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], entry['buckets'])),
+                })
+        return {'started_at': self.started, 'uptime': round(time.time() - self.started, 3), 'series': series}
+    
+    def prometheus(self):
+        """Prometheus 文本格式的指标"""
+        lines = [
+            "# TYPE crawl_stage_seconds histogram",
+        ]
+        counters = {'bytes': [], 'retries': [], 'errors': []}
+        for item in self.snapshot()['series']:
+            labels = f'stage="{item["stage"]}",host="{item["host"]}"'
+            cumulative = 0
+            for bound, count in item['buckets'].items():
+                cumulative += count
+                lines.append(f'crawl_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'crawl_stage_seconds_sum{{{labels}}} {item["seconds_sum"]}')
+            lines.append(f'crawl_stage_seconds_count{{{labels}}} {item["count"]}')
+            counters['bytes'].append(f'crawl_stage_bytes_total{{{labels}}} {item["bytes"]}')
+            counters['retries'].append(f'crawl_stage_retries_total{{{labels}}} {item["retries"]}')
+            for error, count in item['errors'].items():
+                counters['errors'].append(f'crawl_stage_errors_total{{{labels},error="{error}"}} {count}')
+        for name, samples in counters.items():
+            lines.append(f"# TYPE crawl_stage_{name}_total counter")
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+    
+    def flush(self, path):
+        """原子地写出指标文件"""
+        content = self.prometheus() if path.endswith('.prom') else json.dumps(self.snapshot(), indent=2)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    
+    def start_flusher(self, path, interval=METRICS_INTERVAL):
+        """在后台线程中每 interval 秒写出一次指标文件"""
+        def run():
+            while not self.stop_event.wait(interval):
+                try:
+                    self.flush(path)
+                except OSError as e:
+                    print(f"  [WARN] Failed to write metrics: {e}")
+        self.flusher = (threading.Thread(target=run, daemon=True), path)
+        self.flusher[0].start()
+    
+    def stop_flusher(self):
+        """停止后台写出并写出最终结果"""
+        if self.flusher:
+            self.stop_event.set()
+            self.flusher[0].join()
+            self.flush(self.flusher[1])
+            self.flusher = None
+    
+    def summary(self):
+        """每个 (阶段, 主机) 一行的汇总文本"""
+        lines = []
+        for item in self.snapshot()['series']:
+            line = (f"  {item['stage']:<9} {item['host']:<24} n={item['count']:<6} p50={item['p50']:.3f}s "
+                    f"p95={item['p95']:.3f}s max={item['max']:.3f}s")
+            if item['bytes']:
+                line += f" {item['bytes'] / (1024 * 1024):.2f} MB {item['bytes_per_second'] / 1024:.0f} KiB/s"
+            if item['retries']:
+                line += f" retries={item['retries']}"
+            if item['errors']:
+                line += " errors=" + ','.join(f"{k}:{v}" for k, v in item['errors'].items())
+            lines.append(line)
+        return '\n'.join(lines)
+
+# 进程内共享的指标收集器
+METRICS = CrawlMetrics()
+
+# 下载、克隆和详情页请求最终失败时的错误，按URL记录，由调用方取出写入重试队列
+_last_errors = {}
+_last_errors_lock = threading.Lock()
+
+def remember_error(key, exc):
+    """记录 key（URL）最近一次失败的 (错误类别, 错误信息)"""
+    with _last_errors_lock:
+        _last_errors[key] = (error_class(exc), str(exc)[:500])
+
+def take_error(key):
+    """取出并清除 key 最近一次失败的 (错误类别, 错误信息)，没有记录时返回 None"""
+    with _last_errors_lock:
+        return _last_errors.pop(key, None)
+
+class HostRateLimiter:
+    """按主机划分的自适应令牌桶限速器
+    
+    所有HTTP请求发出前调用 acquire()，收到响应后调用 feedback()。
+    遇到 429/503 时速率减半并遵守 Retry-After，连续成功 RAMP_UP_AFTER 次后速率提高 10%。
+    """
+    
+    def __init__(self, rates=None, default_rate=DEFAULT_RATE):
+        self.rates = dict(HOST_RATES, **(rates or {}))
+        self.default_rate = default_rate
+        self.enabled = True
+        self.lock = threading.Lock()
+        self.buckets = {}
+    
+    def _initial_rate(self, host):
+        for suffix, rate in self.rates.items():
+            if host == suffix or host.endswith('.' + suffix):
+                return rate
+        return self.default_rate
+    
+    def _bucket(self, url):
+        host = (urlparse(url).hostname or '').lower()
+        if host not in self.buckets:
+            rate = self._initial_rate(host)
+            self.buckets[host] = {
+                'rate': rate, 'tokens': 1.0, 'updated': time.monotonic(),
+                'blocked_until': 0.0, 'successes': 0, 'last_backoff': 0.0, 'throttled': 0,
+            }
+        return self.buckets[host]
+    
+    def acquire(self, url):
+        """阻塞直到该主机有可用令牌"""
+        if not self.enabled:
+            return
+        waited = 0.0
+        while True:
+            with self.lock:
+                bucket = self._bucket(url)
+                now = time.monotonic()
+                capacity = max(1.0, bucket['rate'])
+                bucket['tokens'] = min(capacity, bucket['tokens'] + (now - bucket['updated']) * bucket['rate'])
+                bucket['updated'] = now
+                if now >= bucket['blocked_until'] and bucket['tokens'] >= 1.0:
+                    bucket['tokens'] -= 1.0
+                    break
+                wait = max(bucket['blocked_until'] - now, (1.0 - bucket['tokens']) / bucket['rate'])
+            time.sleep(wait)
+            waited += wait
+        if waited:
+            METRICS.observe('rate_wait', url, waited)
+    
+    def feedback(self, url, status, retry_after=None):
+        """根据响应状态调整该主机的速率"""
+        if not self.enabled:
+            return
+        with self.lock:
+            bucket = self._bucket(url)
+            now = time.monotonic()
+            if status in THROTTLE_STATUSES:
+                bucket['successes'] = 0
+                bucket['throttled'] += 1
+                # 同一波并发请求同时被限流时只降速一次
+                if now - bucket['last_backoff'] >= 1.0 / bucket['rate']:
+                    bucket['rate'] = max(MIN_RATE, bucket['rate'] * BACKOFF_FACTOR)
+                    bucket['last_backoff'] = now
+                bucket['tokens'] = 0.0
+                delay = parse_retry_after(retry_after)
+                if delay:
+                    bucket['blocked_until'] = max(bucket['blocked_until'], now + delay)
+            elif status < 400:
+                bucket['successes'] += 1
+                if bucket['successes'] >= RAMP_UP_AFTER:
+                    bucket['rate'] = min(MAX_RATE, bucket['rate'] * RAMP_UP_FACTOR)
+                    bucket['successes'] = 0
+    
+    def summary(self):
+        """各主机当前的速率和被限流次数"""
+        with self.lock:
+            return {host: (round(bucket['rate'], 2), bucket['throttled']) for host, bucket in self.buckets.items()}
+
+# 进程内共享的限速器，所有HTTP请求和 git 网络操作都经过它
+RATE_LIMITER = HostRateLimiter()
+
+class RateLimitedAdapter(HTTPAdapter):
+    """每个请求发出前经过限速器，429/503 时等待限速器放行后重发"""
+    
+    def send(self, request, **kwargs):
+        for attempt in range(THROTTLE_RETRIES + 1):
+            RATE_LIMITER.acquire(request.url)
+            response = super().send(request, **kwargs)
+            RATE_LIMITER.feedback(request.url, response.status_code, response.headers.get('Retry-After'))
+            if response.status_code not in THROTTLE_STATUSES or attempt == THROTTLE_RETRIES:
+                return response
+            print(f"      [WARN] HTTP {response.status_code} from {urlparse(request.url).hostname}, slowing down")
+            METRICS.note_retry()
+            response.close()
+
+class ResponseCache:
+    """磁盘HTTP响应缓存
+    
+    响应体经 zlib 压缩后按URL哈希存放，索引保存在 SQLite 中。
+    列表页和详情页使用不同的有效期，总大小超过上限时按最近访问时间淘汰（LRU）。
+    离线模式下只从缓存读取且忽略有效期。
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            url TEXT PRIMARY KEY,
+            path TEXT,
+            size INTEGER,
+            status INTEGER,
+            headers TEXT,
+            stored_at REAL,
+            accessed_at REAL
+        )
+    """
+    
+    def __init__(self, directory, max_bytes=CACHE_MAX_BYTES, ttl=None, offline=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = dict(CACHE_TTL, **(ttl or {}))
+        self.offline = offline
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False)
+        self.conn.execute(self.SCHEMA)
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    
+    @staticmethod
+    def url_class(url):
+        """按URL判断缓存类别：论文详情页或列表页"""
+        return 'detail' if '/paper/' in urlparse(url).path else 'listing'
+    
+    def _path(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key[:2], key[2:] + '.z')
+    
+    def get(self, url):
+        """返回 (status, headers, body)，未命中或已过期时返回 None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT path, status, headers, stored_at FROM entries WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            path, status, headers, stored_at = row
+            if not self.offline and time.time() - stored_at > self.ttl[self.url_class(url)]:
+                return None
+            try:
+                with open(path, 'rb') as f:
+                    body = zlib.decompress(f.read())
+            except (OSError, zlib.error):
+                self._remove(url, path)
+                return None
+            self.conn.execute("UPDATE entries SET accessed_at = ? WHERE url = ?", (time.time(), url))
+            self.conn.commit()
+        return status, json.loads(headers), body
+    
+    def put(self, url, status, headers, body):
+        data = zlib.compress(body)
+        path = self._path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.lock:
+            with open(path, 'wb') as f:
+                f.write(data)
+            old = self.conn.execute("SELECT size FROM entries WHERE url = ?", (url,)).fetchone()
+            if old:
+                self.total_bytes -= old[0]
+            now = time.time()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (url, path, size, status, headers, stored_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, path, len(data), status, json.dumps(dict(headers)), now, now))
+            self.total_bytes += len(data)
+            self._evict()
+            self.conn.commit()
+    
+    def _remove(self, url, path):
+        row = self.conn.execute("SELECT size FROM entries WHERE url = ?", (url,)).fetchone()
+        if row:
+            self.total_bytes -= row[0]
+        self.conn.execute("DELETE FROM entries WHERE url = ?", (url,))
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    
+    def _evict(self):
+        """总大小超过上限时按最近访问时间从旧到新淘汰"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        for url, path in self.conn.execute(
+                "SELECT url, path FROM entries ORDER BY accessed_at").fetchall():
+            if self.total_bytes <= self.max_bytes:
+                break
+            self._remove(url, path)
+
+class CachingAdapter(RateLimitedAdapter):
+    """在 HTTPAdapter 之下透明地读写响应缓存，只缓存 GET 的 200 响应；命中缓存时不经过限速器"""
+    
+    def __init__(self, cache, **kwargs):
+        self.cache = cache
+        super().__init__(**kwargs)
+    
+    def send(self, request, **kwargs):
+        # 条件请求由调用方自行处理 304，不走缓存
+        if request.method != 'GET' or 'If-None-Match' in request.headers \
+                or 'If-Modified-Since' in request.headers:
+            return super().send(request, **kwargs)
+        
+        hit = self.cache.get(request.url)
+        if hit is not None:
+            return self._build_cached_response(request, *hit)
+        if self.cache.offline:
+            return self._build_cached_response(request, 504, {}, b'', reason='Offline cache miss')
+        
+        response = super().send(request, **kwargs)
+        if response.status_code == 200:
+            self.cache.put(request.url, response.status_code, response.headers, response.content)
+        return response
+    
+    def _build_cached_response(self, request, status, headers, body, reason='OK'):
+        response = requests.Response()
+        response.status_code = status
+        response.reason = reason
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = body
+        response.url = request.url
+        response.request = request
+        response.from_cache = True
+        return response
+
+def open_response_cache(directory=None, max_bytes=CACHE_MAX_BYTES, offline=False):
+    """打开响应缓存，默认位于下载目录中"""
+    return ResponseCache(directory or os.path.join(BASE_DOWNLOAD_DIR, CACHE_DIR_NAME),
+                         max_bytes=max_bytes, offline=offline)
+
+def create_session(use_proxy=True, pool_size=10, cache=None):
     session = requests.Session()
+    # 429/503 交给 RateLimitedAdapter 按 Retry-After 和主机速率处理
     retry = Retry(
         total=5,
         backoff_factor=1,
-        status_forcelist=[429, 500, 502, 503, 504]
+        status_forcelist=[500, 502, 504],
+        respect_retry_after_header=False
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    # 连接池大小需不小于并发数，否则多余的连接会被丢弃
+    adapter_kwargs = dict(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    if cache is not None:
+        adapter = CachingAdapter(cache, **adapter_kwargs)
+    else:
+        adapter = RateLimitedAdapter(**adapter_kwargs)
     session.mount('http://', adapter)
     session.mount('https://', adapter)
     session.headers.update({
@@ -77,57 +629,829 @@ def sanitize_filename(name, max_length=50):
     
     return name
 
-def download_file(url, save_path, file_type, max_retries=3):
-    """下载文件并保存到指定路径"""
-    if os.path.exists(save_path) and os.path.getsize(save_path) > 0:
-        print(f"      [INFO] {file_type} already exists: {os.path.basename(save_path)}")
-        return True
+def file_sha256(path):
+    """计算文件的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024*1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def directory_size(path):
+    """目录中所有普通文件的总字节数（不跟随符号链接）"""
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
 
-    # 创建无代理的HTTP连接池
-    http = urllib3.PoolManager(
-        timeout=urllib3.Timeout(connect=5.0, read=60.0),
-        retries=urllib3.Retry(3),
-        maxsize=10
+class CrawlState:
+    """持久化的抓取状态，以论文页面URL为键记录每篇论文的处理进度
+    
+    pdf_status / code_status 取值：done（已完成）、missing（无链接）、failed（失败）。
+    两者都为 done 或 missing 的论文视为已完成，重启后直接跳过，不再发起任何请求。
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS papers (
+            paper_url TEXT PRIMARY KEY,
+            title TEXT,
+            listing_page INTEGER,
+            pdf_url TEXT,
+            code_url TEXT,
+            resolved_at REAL,
+            pdf_status TEXT,
+            pdf_bytes INTEGER,
+            pdf_sha256 TEXT,
+            code_status TEXT,
+            created_at REAL,
+            updated_at REAL
+        )
+    """
+    PAGES_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS listing_pages (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at REAL
+        )
+    """
+    TASKS_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS task_papers (
+            task TEXT,
+            paper_url TEXT,
+            PRIMARY KEY (task, paper_url)
+        )
+    """
+    # 增量抓取的高水位：各任务最近一次完整结束的增量抓取开始时列表第一页上的论文
+    MARKS_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS incremental_marks (
+            task TEXT PRIMARY KEY,
+            paper_urls TEXT,
+            finished_at REAL
+        )
+    """
+    # 重试队列：每篇论文每个阶段（detail / pdf / code）一行，dead = 1 表示已移入死信列表
+    FAILURES_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS failures (
+            paper_url TEXT,
+            stage TEXT,
+            error TEXT,
+            message TEXT,
+            attempts INTEGER,
+            next_attempt_at REAL,
+            dead INTEGER DEFAULT 0,
+            updated_at REAL,
+            PRIMARY KEY (paper_url, stage)
+        )
+    """
+    # 建表后新增的列，打开旧数据库时自动补齐
+    EXTRA_COLUMNS = {
+        'code_head': 'TEXT',
+        'code_checked_at': 'REAL',
+        'arxiv_id': 'TEXT',
+        'published': 'TEXT',
+        'stars': 'INTEGER',
+        'frameworks': 'TEXT',
+        'pdf_path': 'TEXT',
+        'pdf_seconds': 'REAL',
+        'code_path': 'TEXT',
+        'code_bytes': 'INTEGER',
+        'code_seconds': 'REAL',
+    }
+    INDEXES = (
+        "CREATE INDEX IF NOT EXISTS papers_pdf_status ON papers (pdf_status)",
+        "CREATE INDEX IF NOT EXISTS papers_code_status ON papers (code_status)",
+        "CREATE INDEX IF NOT EXISTS task_papers_paper ON task_papers (paper_url)",
     )
+    # --query 默认输出的列
+    QUERY_COLUMNS = ('title', 'pdf_status', 'code_status', 'pdf_bytes', 'paper_url')
+    FINISHED = ('done', 'missing')
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(self.SCHEMA)
+        self.conn.execute(self.PAGES_SCHEMA)
+        self.conn.execute(self.TASKS_SCHEMA)
+        self.conn.execute(self.FAILURES_SCHEMA)
+        self.conn.execute(self.MARKS_SCHEMA)
+        existing = {row['name'] for row in self.conn.execute("PRAGMA table_info(papers)")}
+        for name, column_type in self.EXTRA_COLUMNS.items():
+            if name not in existing:
+                self.conn.execute(f"ALTER TABLE papers ADD COLUMN {name} {column_type}")
+        for statement in self.INDEXES:
+            self.conn.execute(statement)
+        self.conn.commit()
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+    
+    def get(self, paper_url):
+        """获取论文记录，不存在时返回 None"""
+        with self.lock:
+            return self.conn.execute("SELECT * FROM papers WHERE paper_url = ?", (paper_url,)).fetchone()
+    
+    def is_complete(self, paper_url):
+        """论文的PDF和代码是否都已处理完成"""
+        row = self.get(paper_url)
+        return row is not None and row['pdf_status'] in self.FINISHED and row['code_status'] in self.FINISHED
+    
+    def _update(self, paper_url, **fields):
+        now = time.time()
+        fields['updated_at'] = now
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO papers (paper_url, created_at) VALUES (?, ?)", (paper_url, now))
+            self.conn.execute(
+                f"UPDATE papers SET {columns} WHERE paper_url = ?", (*fields.values(), paper_url))
+            self.conn.commit()
+    
+    def record_listing(self, paper_url, title, listing_page=None, card=None):
+        """记录列表页上出现的论文，card 为列表页卡片解析出的元数据"""
+        fields = {}
+        if card:
+            fields = {'arxiv_id': card['arxiv_id'], 'published': card['date'], 'stars': card['stars'],
+                      'frameworks': ','.join(card['frameworks']) or None}
+        self._update(paper_url, title=title, listing_page=listing_page, **fields)
+    
+    def record_task(self, task, paper_url):
+        """记录论文出现在某个任务的列表中"""
+        with self.lock:
+            self.conn.execute("INSERT OR IGNORE INTO task_papers (task, paper_url) VALUES (?, ?)", (task, paper_url))
+            self.conn.commit()
+    
+    def tasks_for(self, paper_url):
+        """论文所属的全部任务"""
+        with self.lock:
+            rows = self.conn.execute("SELECT task FROM task_papers WHERE paper_url = ?", (paper_url,)).fetchall()
+        return [row[0] for row in rows]
+    
+    def record_details(self, paper_url, pdf_url, code_url):
+        """记录详情页解析出的PDF和代码链接"""
+        self._update(paper_url, pdf_url=pdf_url, code_url=code_url, resolved_at=time.time(),
+                     **({} if pdf_url else {'pdf_status': 'missing'}),
+                     **({} if code_url else {'code_status': 'missing'}))
+    
+    def record_pdf(self, paper_url, digest, path=None, seconds=None):
+        """记录PDF下载结果、本地路径、大小、校验和与耗时，digest 为 None 表示下载失败"""
+        if digest and path and os.path.exists(path):
+            self._update(paper_url, pdf_status='done', pdf_bytes=os.path.getsize(path), pdf_sha256=digest,
+                         pdf_path=path, pdf_seconds=seconds)
+        else:
+            self._update(paper_url, pdf_status='failed', pdf_seconds=seconds)
+    
+    def find_pdf_digest(self, pdf_url):
+        """查找同一PDF链接已下载内容的SHA-256"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT pdf_sha256 FROM papers WHERE pdf_url = ? AND pdf_status = 'done' "
+                "AND pdf_sha256 IS NOT NULL LIMIT 1", (pdf_url,)).fetchone()
+        return row[0] if row else None
+    
+    def record_code(self, paper_url, ok, code_dir=None, seconds=None):
+        """记录代码仓库克隆结果、检出的提交、本地路径、大小与耗时"""
+        if ok:
+            head = repo_head(code_dir) if code_dir else None
+            self._update(paper_url, code_status='done', code_head=head, code_checked_at=time.time(),
+                         code_path=code_dir, code_bytes=directory_size(code_dir) if code_dir else None,
+                         code_seconds=seconds)
+        else:
+            self._update(paper_url, code_status='failed', code_seconds=seconds)
+    
+    def record_code_head(self, paper_url, head):
+        """记录刷新时看到的远端 HEAD"""
+        self._update(paper_url, code_head=head, code_checked_at=time.time())
+    
+    def cloned_papers(self):
+        """所有已成功克隆代码的论文"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT * FROM papers WHERE code_status = 'done' AND code_url IS NOT NULL").fetchall()
+    
+    def get_page_validators(self, url):
+        """获取列表页上次响应的 (ETag, Last-Modified)"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT etag, last_modified FROM listing_pages WHERE url = ?", (url,)).fetchone()
+        return (row['etag'], row['last_modified']) if row else (None, None)
+    
+    def save_page_validators(self, url, etag, last_modified):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO listing_pages (url, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?)",
+                (url, etag, last_modified, time.time()))
+            self.conn.commit()
+    
+    def get_incremental_mark(self, task):
+        """上次完整结束的增量抓取覆盖到的论文URL集合，没有时为空集合"""
+        with self.lock:
+            row = self.conn.execute("SELECT paper_urls FROM incremental_marks WHERE task = ?", (task,)).fetchone()
+        return set(json.loads(row['paper_urls'])) if row else set()
+    
+    def save_incremental_mark(self, task, paper_urls):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO incremental_marks (task, paper_urls, finished_at) VALUES (?, ?, ?)",
+                (task, json.dumps(list(paper_urls)), time.time()))
+            self.conn.commit()
+    
+    def record_failure(self, paper_url, stage, error):
+        """记录某阶段的失败，按失败次数指数退避计算下次可重试的时间，次数用尽时移入死信列表"""
+        error_name, message = error
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT attempts FROM failures WHERE paper_url = ? AND stage = ?",
+                                    (paper_url, stage)).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempts - 1))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO failures (paper_url, stage, error, message, attempts, next_attempt_at, "
+                "dead, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (paper_url, stage, error_name, message, attempts, now + delay,
+                 int(attempts >= RETRY_MAX_ATTEMPTS), now))
+            self.conn.commit()
+        if attempts >= RETRY_MAX_ATTEMPTS:
+            print(f"      [WARN] {stage} failed {attempts} times, moved to dead letters: {paper_url}")
+    
+    def clear_failure(self, paper_url, stage):
+        """阶段成功后从重试队列中移除"""
+        with self.lock:
+            self.conn.execute("DELETE FROM failures WHERE paper_url = ? AND stage = ?", (paper_url, stage))
+            self.conn.commit()
+    
+    def is_deferred(self, paper_url):
+        """论文是否在重试队列中等待退避时间或已进入死信列表（只由 --retry 处理）"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM failures WHERE paper_url = ? AND (dead = 1 OR next_attempt_at > ?) LIMIT 1",
+                (paper_url, time.time())).fetchone()
+        return row is not None
+    
+    def due_failures(self, include_dead=False):
+        """已到重试时间的论文URL列表；include_dead 时包括死信列表中的论文"""
+        condition = "1" if include_dead else "dead = 0 AND next_attempt_at <= ?"
+        params = () if include_dead else (time.time(),)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT DISTINCT paper_url FROM failures WHERE {condition} ORDER BY paper_url", params).fetchall()
+        return [row[0] for row in rows]
+    
+    def reset_failures(self, paper_url):
+        """重新开始计数（从死信列表中取回）"""
+        with self.lock:
+            self.conn.execute("UPDATE failures SET attempts = 0, dead = 0 WHERE paper_url = ?", (paper_url,))
+            self.conn.commit()
+    
+    def failures(self, dead=None):
+        """重试队列中的失败记录，dead 为 True/False 时只返回死信/待重试的记录"""
+        condition = "1" if dead is None else f"dead = {int(dead)}"
+        with self.lock:
+            return self.conn.execute(
+                f"SELECT f.*, p.title FROM failures f LEFT JOIN papers p ON p.paper_url = f.paper_url "
+                f"WHERE {condition} ORDER BY f.next_attempt_at").fetchall()
+    
+    def query(self, where=None, columns=None, limit=None):
+        """按 SQL 条件查询论文清单，返回 (列名, 行列表)；条件中可以使用 papers 表的全部列"""
+        columns = columns or self.QUERY_COLUMNS
+        sql = f"SELECT {', '.join(columns)} FROM papers"
+        if where:
+            sql += f" WHERE {where}"
+        sql += " ORDER BY created_at"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self.lock:
+            cursor = self.conn.execute(sql)
+            return [d[0] for d in cursor.description], cursor.fetchall()
+    
+    def stats(self):
+        """汇总论文数量、各状态计数、PDF和代码的总大小与平均耗时、各任务论文数"""
+        with self.lock:
+            totals = self.conn.execute(
+                "SELECT COUNT(*), COUNT(resolved_at), "
+                "SUM(CASE WHEN pdf_status = 'done' THEN pdf_bytes END), "
+                "SUM(CASE WHEN code_status = 'done' THEN code_bytes END), "
+                "AVG(pdf_seconds), AVG(code_seconds) FROM papers").fetchone()
+            # 相同内容的PDF是同一对象的硬链接，磁盘占用按不同的 SHA-256 计算
+            pdf_disk_bytes = self.conn.execute(
+                "SELECT SUM(b) FROM (SELECT MAX(pdf_bytes) AS b FROM papers WHERE pdf_status = 'done' "
+                "GROUP BY COALESCE(pdf_sha256, paper_url))").fetchone()[0]
+            pdf_status = self.conn.execute(
+                "SELECT COALESCE(pdf_status, 'pending'), COUNT(*) FROM papers GROUP BY 1 ORDER BY 2 DESC").fetchall()
+            code_status = self.conn.execute(
+                "SELECT COALESCE(code_status, 'pending'), COUNT(*) FROM papers GROUP BY 1 ORDER BY 2 DESC").fetchall()
+            tasks = self.conn.execute(
+                "SELECT task, COUNT(*) FROM task_papers GROUP BY task ORDER BY 2 DESC").fetchall()
+            failures = self.conn.execute(
+                "SELECT stage || CASE dead WHEN 1 THEN ' (dead)' ELSE '' END, COUNT(*) FROM failures "
+                "GROUP BY 1 ORDER BY 1").fetchall()
+        return {
+            'papers': totals[0],
+            'resolved': totals[1],
+            'pdf_bytes': totals[2] or 0,
+            'pdf_disk_bytes': pdf_disk_bytes or 0,
+            'code_bytes': totals[3] or 0,
+            'avg_pdf_seconds': totals[4],
+            'avg_code_seconds': totals[5],
+            'pdf_status': dict(pdf_status),
+            'code_status': dict(code_status),
+            'tasks': dict(tasks),
+            'failures': dict(failures),
+        }
+    
+    def completed_count(self):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM papers WHERE pdf_status IN ('done', 'missing') "
+                "AND code_status IN ('done', 'missing')").fetchone()[0]
+
+def open_crawl_state(path=None, create=True):
+    """打开抓取状态数据库，默认位于下载目录中；create 为假且数据库不存在时返回 None"""
+    path = path or os.path.join(BASE_DOWNLOAD_DIR, STATE_DB_NAME)
+    if not create and not os.path.exists(path):
+        return None
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return CrawlState(path)
+
+class DownloadClient:
+    """长期复用的无代理下载客户端
+    
+    所有PDF下载共享同一个 PoolManager，每个主机一个连接池并保持 keep-alive，
+    同时统计请求数和新建连接数，用于确认连接复用节省的握手次数。
+    """
+    
+    def __init__(self, max_connections_per_host=DOWNLOAD_CONNECTIONS_PER_HOST, num_pools=50):
+        self.lock = threading.Lock()
+        self.counters = {'requests': 0, 'new_connections': 0}
+        self.pool = urllib3.PoolManager(
+            num_pools=num_pools,
+            maxsize=max_connections_per_host,
+            block=True,
+            timeout=urllib3.Timeout(connect=5.0, read=60.0),
+            # 429/503 的 Retry-After 由限速器处理
+            retries=urllib3.Retry(3, respect_retry_after_header=False)
+        )
+        self.pool.pool_classes_by_scheme = {
+            'http': self._counting_pool(urllib3.HTTPConnectionPool),
+            'https': self._counting_pool(urllib3.HTTPSConnectionPool),
+        }
+    
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+    
+    def _counting_pool(self, base):
+        client = self
+        
+        # 在连接对象的 connect() 中计数，断开后重连也算一次新握手
+        class CountingConnection(base.ConnectionCls):
+            def connect(self):
+                client._count('new_connections')
+                return super().connect()
+        
+        class CountingPool(base):
+            ConnectionCls = CountingConnection
+            
+            def urlopen(self, *args, **kwargs):
+                client._count('requests')
+                return super().urlopen(*args, **kwargs)
+        
+        return CountingPool
     
-    for attempt in range(max_retries):
+    def request(self, method, url, **kwargs):
+        RATE_LIMITER.acquire(url)
+        response = self.pool.request(method, url, **kwargs)
+        RATE_LIMITER.feedback(url, response.status, response.headers.get('Retry-After'))
+        return response
+    
+    def stats(self):
+        """返回请求数、新建连接数和复用连接数"""
+        with self.lock:
+            counters = dict(self.counters)
+        counters['reused_connections'] = max(0, counters['requests'] - counters['new_connections'])
+        return counters
+
+_download_client = None
+_download_client_lock = threading.Lock()
+
+def get_download_client(max_connections_per_host=None):
+    """获取进程内共享的下载客户端，首次调用时创建"""
+    global _download_client
+    with _download_client_lock:
+        if _download_client is None:
+            _download_client = DownloadClient(max_connections_per_host or DOWNLOAD_CONNECTIONS_PER_HOST)
+        return _download_client
+
+def object_store_dir():
+    return OBJECT_STORE_DIR or os.path.join(BASE_DOWNLOAD_DIR, ".objects")
+
+def object_path(digest):
+    """内容寻址对象路径：objects/ab/cdef..."""
+    return os.path.join(object_store_dir(), digest[:2], digest[2:])
+
+def _reflink(src, dst):
+    """尝试写时复制克隆文件（Linux FICLONE），不支持时抛出 OSError"""
+    import fcntl
+    FICLONE = 0x40049409
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
         try:
-            os.makedirs(os.path.dirname(save_path), exist_ok=True)
-            print(f"      Downloading {file_type} from: {url}")
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+
+def link_object(digest, save_path):
+    """把对象以硬链接（其次 reflink，最后复制）的形式放到目标路径"""
+    src = object_path(digest)
+    tmp_path = save_path + '.link'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        try:
+            _reflink(src, tmp_path)
+        except (OSError, ImportError):
+            shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, save_path)
+
+def store_object(path, digest):
+    """把已完成的文件移入对象存储，内容已存在时丢弃这份副本"""
+    dst = object_path(digest)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.exists(dst):
+        os.remove(path)
+    else:
+        os.replace(path, dst)
+    return dst
+
+def parse_content_range(value):
+    """解析 Content-Range 头，返回 (起始字节, 总长度)，无法解析的部分为 None"""
+    match = re.match(r'bytes\s+(?:(\d+)-\d+|\*)/(\d+|\*)', value or '')
+    if not match:
+        return None, None
+    start = int(match.group(1)) if match.group(1) is not None else None
+    total = int(match.group(2)) if match.group(2) != '*' else None
+    return start, total
+
+def load_segment_progress(progress_path, url):
+    """读取分段下载的进度文件，与当前URL不符或损坏时返回 None"""
+    try:
+        with open(progress_path, encoding='utf-8') as f:
+            progress = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return progress if progress.get('url') == url else None
+
+def save_segment_progress(progress_path, progress):
+    tmp_path = progress_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, progress_path)
+
+def download_segmented(http, url, part_path, total_size, file_type, sample, first_response=None, source=None):
+    """把文件分成若干字节区间，在共享连接池上并发下载到预分配的 .part 文件中
+    
+    每段用独立的文件句柄写入自己的区间（大缓冲区写入），每写满一个缓冲区就把进度记录到
+    .part.json，中断后各段从已写入的位置续传。first_response 是已经发出的 bytes=0- 请求，
+    直接用作第一段。服务器对分段请求返回 200（不支持 Range）时删除已下载的部分，抛出异常后从头单连接下载。
+    进度以 url 为键，各段实际请求 source（对冲请求胜出的镜像），默认同 url。
+    """
+    source = source or url
+    progress_path = part_path + '.json'
+    progress = load_segment_progress(progress_path, url)
+    if progress is None or progress['total'] != total_size or not os.path.exists(part_path):
+        count = max(1, min(DOWNLOAD_SEGMENTS, total_size // max(1, SEGMENTED_THRESHOLD // DOWNLOAD_SEGMENTS) or 1))
+        size = -(-total_size // count)
+        progress = {'url': url, 'total': total_size, 'segments': [
+            {'start': start, 'end': min(start + size, total_size) - 1, 'done': 0}
+            for start in range(0, total_size, size)]}
+        # 先写进度文件再扩展 .part：没有匹配进度文件的 .part 不会被当作已下载的内容
+        save_segment_progress(progress_path, progress)
+        with open(part_path, 'wb') as f:
+            f.truncate(total_size)
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(f.fileno(), 0, total_size)
+    
+    lock = threading.Lock()
+    errors = []
+    bar = tqdm(desc=f"      Downloading {file_type} ({len(progress['segments'])} segments)", total=total_size,
+               initial=sum(seg['done'] for seg in progress['segments']), unit='iB', unit_scale=True,
+               unit_divisor=1024, leave=False)
+    
+    def fetch(segment, response=None):
+        position = segment['start'] + segment['done']
+        if position > segment['end']:
+            return
+        remaining = segment['end'] - position + 1
+        try:
+            if response is None:
+                response = http.request('GET', source, headers={'Range': f"bytes={position}-{segment['end']}"},
+                                        preload_content=False)
+                if response.status == 200:
+                    response.drain_conn()
+                    progress['reset'] = True
+                    raise Exception("Server ignored Range request")
+                if response.status != 206:
+                    response.drain_conn()
+                    raise Exception(f"HTTP {response.status}")
+                if parse_content_range(response.headers.get('content-range'))[0] != position:
+                    response.drain_conn()
+                    raise Exception(f"Unexpected Content-Range {response.headers.get('content-range')}")
+            with open(part_path, 'r+b', buffering=WRITE_BUFFER_SIZE) as f:
+                f.seek(position)
+                unflushed = 0
+                while remaining > 0:
+                    chunk = response.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise Exception(f"Connection closed with {remaining} bytes left in segment")
+                    f.write(chunk)
+                    remaining -= len(chunk)
+                    unflushed += len(chunk)
+                    if unflushed >= WRITE_BUFFER_SIZE or remaining == 0:
+                        f.flush()
+                        with lock:
+                            segment['done'] += unflushed
+                            sample['bytes'] += unflushed
+                            bar.update(unflushed)
+                            save_segment_progress(progress_path, progress)
+                        unflushed = 0
+        except Exception as e:
+            with lock:
+                errors.append(e)
+        finally:
+            if response is not None:
+                # 第一段的响应在本段结束处截断，连接不能复用
+                if remaining > 0 or response is first_response:
+                    response.close()
+                response.release_conn()
+    
+    try:
+        segments = progress['segments']
+        with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+            futures = [executor.submit(fetch, segment, first_response if i == 0 and segment['done'] == 0 else None)
+                       for i, segment in enumerate(segments)]
+            if first_response is not None and futures and segments[0]['done'] != 0:
+                first_response.close()
+            for future in futures:
+                future.result()
+    finally:
+        bar.close()
+    if progress.get('reset'):
+        os.remove(part_path)
+        os.remove(progress_path)
+    if errors:
+        raise errors[0]
+    os.remove(progress_path)
+
+def hedged_request(http, urls, headers, delay=None):
+    """向候选地址发起 GET 请求，返回 (url, response)
+    
+    先请求第一个地址，delay 秒内没有收到响应头就向下一个地址发出对冲请求，出错时立即切换；
+    最先返回可用状态码的响应胜出，其余请求的响应到达后直接关闭。全部失败时抛出最后一个错误。
+    """
+    delay = HEDGE_DELAY if delay is None else delay
+    results = Queue()
+    lock = threading.Lock()
+    chosen = []
+
+    def fetch(index):
+        start = time.monotonic()
+        try:
+            response = http.request('GET', urls[index], headers=headers, preload_content=False)
+        except Exception as e:
+            results.put((index, None, e))
+            return
+        METRICS.observe('first_byte', urls[index], time.monotonic() - start)
+        with lock:
+            if chosen:
+                # 关闭后仍要归还连接池中的名额，否则 block=True 的连接池会被耗尽
+                response.close()
+                response.release_conn()
+                return
+            results.put((index, response, None))
+
+    def launch():
+        nonlocal launched
+        threading.Thread(target=fetch, args=(launched,), daemon=True).start()
+        launched += 1
+
+    launched = finished = 0
+    error = None
+    launch()
+    while finished < launched:
+        try:
+            timeout = delay if delay and launched < len(urls) else None
+            index, response, exc = results.get(timeout=timeout)
+        except Empty:
+            print(f"      [INFO] No response from {urls[launched - 1]} after {delay:g}s, "
+                  f"also trying {urls[launched]}")
+            launch()
+            continue
+        finished += 1
+        if response is not None and response.status in (200, 206, 416):
+            with lock:
+                chosen.append(index)
+            # 与胜出者同时到达的响应也要关闭
+            while not results.empty():
+                _, other, _ = results.get()
+                if other is not None:
+                    other.close()
+                    other.release_conn()
+            return urls[index], response
+        if response is not None:
+            response.drain_conn()
+            response.release_conn()
+            exc = Exception(f"HTTP {response.status}")
+        error = exc
+        if launched < len(urls):
+            print(f"      [WARN] {urls[index]} failed ({exc}), trying {urls[launched]}")
+            launch()
+    raise error
+
+def download_file(url, save_path, file_type, max_retries=3, candidates=None):
+    """下载文件并保存到指定路径，成功时返回内容的SHA-256，失败返回 None
+    
+    数据先写入 .part 文件并在写入时计算SHA-256，中断后用 Range 请求从已有字节处续传。
+    大于 SEGMENTED_THRESHOLD 且服务器支持 Range 的文件分段并发下载（进度记录在 .part.json 中），
+    下载完成后再计算SHA-256。长度与 Content-Length 一致后移入内容寻址存储，目标路径是指向该对象的硬链接。
+    candidates 是内容相同的候选地址（如 arXiv 镜像），有多个时用对冲请求取最先响应的一个。
+    """
+    if os.path.exists(save_path) and os.path.getsize(save_path) > 0:
+        print(f"      [INFO] {file_type} already exists: {os.path.basename(save_path)}")
+        digest = file_sha256(save_path)
+        # 早期下载的文件也纳入对象存储，后续相同内容可以直接链接
+        if not os.path.exists(object_path(digest)):
+            os.makedirs(os.path.dirname(object_path(digest)), exist_ok=True)
+            try:
+                os.link(save_path, object_path(digest))
+            except OSError:
+                shutil.copyfile(save_path, object_path(digest))
+        return digest
+
+    # 共享的无代理HTTP连接池
+    http = get_download_client()
+    part_path = save_path + '.part'
+    candidates = candidates or [url]
+    
+    with METRICS.measure('download', url) as sample:
+        for attempt in range(max_retries):
+            response = None
+            try:
+                os.makedirs(os.path.dirname(save_path), exist_ok=True)
+                progress = load_segment_progress(part_path + '.json', url) if os.path.exists(part_path) else None
+                if progress:
+                    # 上次分段下载中断，各段从记录的位置续传
+                    print(f"      Resuming segmented {file_type} from: {url}")
+                    download_segmented(http, url, part_path, progress['total'], file_type, sample,
+                                       source=candidates[0])
+                    digest = file_sha256(part_path)
+                    store_object(part_path, digest)
+                    link_object(digest, save_path)
+                    print(f"      Successfully downloaded {file_type}")
+                    return digest
+                if os.path.exists(part_path + '.json'):
+                    # 进度文件属于其他URL或已损坏，预分配的 .part 中可能是未写入的空洞，不能续传
+                    os.remove(part_path + '.json')
+                    if os.path.exists(part_path):
+                        os.remove(part_path)
+                
+                offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+                # 从头下载时也带上 Range，206 响应同时说明服务器支持分段下载
+                headers = {'Range': f'bytes={offset}-'}
+                if offset:
+                    print(f"      Resuming {file_type} at byte {offset} from: {url}")
+                else:
+                    print(f"      Downloading {file_type} from: {url}")
             
-            # 使用urllib3直接下载
-            response = http.request('GET', url, preload_content=False)
+                # 使用urllib3直接下载
+                if len(candidates) > 1:
+                    source, response = hedged_request(http, candidates, headers)
+                else:
+                    source = candidates[0]
+                    response = http.request('GET', source, headers=headers, preload_content=False)
             
-            if response.status != 200:
-                raise Exception(f"HTTP {response.status}")
+                if response.status == 416 and offset:
+                    # 已有部分不小于文件长度或服务器上的文件已变化；这样的 .part 可能是中断的预分配文件
+                    # （没有进度文件），内容无法确认，从头下载
+                    response.drain_conn()
+                    os.remove(part_path)
+                    raise Exception("HTTP 416, restarting from byte 0")
             
-            total_size = int(response.headers.get('content-length', 0))
-            with open(save_path, 'wb') as f, tqdm(
-                desc=f"      Downloading {file_type}",
-                total=total_size,
-                unit='iB',
-                unit_scale=True,
-                unit_divisor=1024,
-                leave=False
-            ) as bar:
-                while True:
-                    chunk = response.read(1024*4)
-                    if not chunk:
-                        break
-                    f.write(chunk)
-                    bar.update(len(chunk))
+                if response.status == 206:
+                    range_start, total_size = parse_content_range(response.headers.get('content-range'))
+                    if range_start != offset:
+                        response.drain_conn()
+                        if os.path.exists(part_path):
+                            os.remove(part_path)
+                        raise Exception(f"Unexpected Content-Range {response.headers.get('content-range')}")
+                    if not offset and total_size and total_size >= SEGMENTED_THRESHOLD and DOWNLOAD_SEGMENTS > 1:
+                        download_segmented(http, url, part_path, total_size, file_type, sample, response, source)
+                        digest = file_sha256(part_path)
+                        store_object(part_path, digest)
+                        link_object(digest, save_path)
+                        print(f"      Successfully downloaded {file_type}")
+                        return digest
+                    mode = 'ab' if offset else 'wb'
+                    # 续传时先用已有的字节初始化哈希
+                    hasher = hashlib.sha256()
+                    if offset:
+                        with open(part_path, 'rb') as f:
+                            for chunk in iter(lambda: f.read(1024*1024), b''):
+                                hasher.update(chunk)
+                elif response.status == 200:
+                    # 服务器不支持 Range 时从头开始
+                    offset = 0
+                    length = response.headers.get('content-length')
+                    total_size = int(length) if length else None
+                    mode = 'wb'
+                    hasher = hashlib.sha256()
+                else:
+                    # 读完错误页的响应体，连接可以继续复用
+                    response.drain_conn()
+                    raise Exception(f"HTTP {response.status}")
             
-            response.release_conn()
-            print(f"      Successfully downloaded {file_type}")
-            return True
+                with open(part_path, mode, buffering=WRITE_BUFFER_SIZE) as f, tqdm(
+                    desc=f"      Downloading {file_type}",
+                    total=total_size or 0,
+                    initial=offset,
+                    unit='iB',
+                    unit_scale=True,
+                    unit_divisor=1024,
+                    leave=False
+                ) as bar:
+                    while True:
+                        chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        bar.update(len(chunk))
+                        sample['bytes'] += len(chunk)
             
-        except Exception as e:
-            print(f"      [ERROR] Download failed (attempt {attempt + 1}/{max_retries}): {e}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)
-            else:
-                return False
-    return False
+                received = os.path.getsize(part_path)
+                if total_size is not None and received != total_size:
+                    raise Exception(f"Incomplete download: {received}/{total_size} bytes")
+            
+                digest = hasher.hexdigest()
+                store_object(part_path, digest)
+                link_object(digest, save_path)
+                print(f"      Successfully downloaded {file_type}")
+                return digest
+            
+            except Exception as e:
+                print(f"      [ERROR] Download failed (attempt {attempt + 1}/{max_retries}): {e}")
+                # 未读完的连接不能放回连接池复用
+                if response is not None and response.status in (200, 206):
+                    response.close()
+                if attempt < max_retries - 1:
+                    sample['retries'] += 1
+                    time.sleep(2 ** attempt)
+                else:
+                    sample['error'] = error_class(e)
+                    remember_error(url, e)
+                    return None
+            finally:
+                if response is not None:
+                    response.release_conn()
+        return None
+
+def canonical_pdf_url(pdf_url):
+    """arXiv 的 abs/pdf、带版本号或镜像主机的链接统一为不带版本号的 ARXIV_PDF_URL，其他链接原样返回"""
+    arxiv_id = find_arxiv_id(pdf_url) if pdf_url else None
+    return ARXIV_PDF_URL.format(arxiv_id=arxiv_id) if arxiv_id else pdf_url
+
+def pdf_candidates(pdf_url):
+    """PDF 的候选下载地址：arXiv 论文依次为各镜像上的地址，其他链接只有自身"""
+    arxiv_id = find_arxiv_id(pdf_url)
+    if not arxiv_id:
+        return [pdf_url]
+    return [f"{mirror.rstrip('/')}/pdf/{arxiv_id}" for mirror in ARXIV_MIRRORS] or [pdf_url]
+
+def download_pdf(pdf_url, pdf_path, state=None):
+    """下载论文PDF；同一篇论文（按规范化链接）的内容已在对象存储中时直接链接，不再下载"""
+    canonical = canonical_pdf_url(pdf_url)
+    digest = None
+    if state:
+        digest = state.find_pdf_digest(canonical)
+        if not digest and canonical != pdf_url:
+            digest = state.find_pdf_digest(pdf_url)
+    if digest and os.path.exists(object_path(digest)):
+        os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+        link_object(digest, pdf_path)
+        print(f"      [INFO] PDF linked from object store: {digest[:12]}")
+        return digest
+    return download_file(pdf_url, pdf_path, "PDF", candidates=pdf_candidates(pdf_url))
 
 def process_github_url(url):
     """处理GitHub URL，转换为正确的仓库URL"""
@@ -148,11 +1472,88 @@ def process_github_url(url):
             return url + '.git'
     return url
 
-def clone_repository(repo_url, save_path, max_retries=3):
-    """克隆GitHub仓库"""
+def run_git(args, cwd=None, timeout=120):
+    """运行 git 命令，失败时抛出带 stderr 的异常"""
+    result = subprocess.run(['git'] + args, cwd=cwd, capture_output=True, text=True, timeout=timeout)
+    if result.returncode != 0:
+        raise Exception(result.stderr.strip() or f"git {args[0]} exited with {result.returncode}")
+    return result.stdout
+
+def missing_blob_paths(repo_dir):
+    """部分克隆后被过滤掉（尚未下载）的文件路径，查询时不会触发按需下载"""
+    objects = run_git(['rev-list', '--objects', '--missing=print', 'HEAD'], cwd=repo_dir)
+    missing = {line[1:].strip() for line in objects.splitlines() if line.startswith('?')}
+    if not missing:
+        return []
+    paths = []
+    for line in run_git(['ls-tree', '-r', '-z', 'HEAD'], cwd=repo_dir).split('\0'):
+        if not line:
+            continue
+        info, path = line.split('\t', 1)
+        if info.split()[2] in missing:
+            paths.append(path)
+    return paths
+
+def sparse_pattern_escape(path):
+    return '/' + re.sub(r'([*?\[\\!#])', r'\\\1', path)
+
+def clear_directory(path):
+    """清空目录内容，保留目录本身"""
+    for name in os.listdir(path):
+        target = os.path.join(path, name)
+        if os.path.isdir(target) and not os.path.islink(target):
+            shutil.rmtree(target, ignore_errors=True)
+        else:
+            os.remove(target)
+
+def git_mirror_dir():
+    return GIT_MIRROR_DIR or os.path.join(BASE_DOWNLOAD_DIR, ".mirrors")
+
+def mirror_path(processed_url):
+    """按 process_github_url 的结果生成镜像目录，如 github.com_owner_repo.git"""
+    parsed = urlparse(processed_url)
+    name = re.sub(r'[^A-Za-z0-9._-]+', '_', (parsed.netloc + parsed.path).strip('/'))
+    return os.path.join(git_mirror_dir(), name)
+
+_mirror_locks = {}
+_mirror_locks_guard = threading.Lock()
+
+def mirror_lock(path):
+    """同一镜像上的 git 操作需要串行执行"""
+    with _mirror_locks_guard:
+        return _mirror_locks.setdefault(path, threading.Lock())
+
+def ensure_mirror(processed_url):
+    """确保仓库的裸镜像存在，不存在时从网络克隆一次，返回镜像路径"""
+    path = mirror_path(processed_url)
+    # 同一仓库的并发克隆等待第一个镜像完成后直接复用
+    with mirror_lock(path):
+        if os.path.exists(path):
+            return path
+        print(f"      Creating git mirror: {processed_url}")
+        tmp_path = path + '.tmp'
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(git_mirror_dir(), exist_ok=True)
+        RATE_LIMITER.acquire(processed_url)
+        run_git(['clone', '--bare', '--depth', '1', processed_url, tmp_path])
+        os.replace(tmp_path, path)
+        return path
+
+def clone_repository(repo_url, save_path, max_retries=3, blob_filter=None, sparse_paths=None):
+    """克隆GitHub仓库
+    
+    blob_filter 对应 git clone --filter（如 blob:none、blob:limit=1m），sparse_paths 为稀疏检出的路径模式。
+    blob:none 只按需下载检出路径中的文件；blob:limit 过滤掉的大文件会从检出中排除，避免检出时又按需下载。
+    启用镜像缓存时在本地浅裸镜像上创建 worktree（浅仓库不能作为 --reference/alternates），
+    不复制对象也不访问网络；此时不再使用 blob 过滤，稀疏检出仍然有效。
+    """
+    blob_filter = CLONE_FILTER if blob_filter is None else blob_filter
+    sparse_paths = CLONE_SPARSE_PATHS if sparse_paths is None else sparse_paths
     processed_url = process_github_url(repo_url)
     if not processed_url or not processed_url.endswith('.git'):
         print(f"      [WARN] Invalid GitHub URL: {repo_url}")
+        remember_error(repo_url, ValueError(f"Invalid GitHub URL: {repo_url}"))
         return False
         
     if os.path.exists(os.path.join(save_path, ".git")):
@@ -160,53 +1561,232 @@ def clone_repository(repo_url, save_path, max_retries=3):
         return True
     if os.path.exists(save_path) and os.listdir(save_path):
         print(f"      [WARN] Directory exists but not a git repo: {save_path}")
+        remember_error(repo_url, FileExistsError(f"Directory exists but not a git repo: {save_path}"))
         return False
         
     os.makedirs(save_path, exist_ok=True)
+    partial = bool(blob_filter or sparse_paths)
     
-    for attempt in range(max_retries):
-        try:
-            print(f"      Cloning repository: {processed_url}")
-            result = subprocess.run(
-                ['git', 'clone', '--depth', '1', processed_url, save_path],
-                capture_output=True,
-                text=True,
-                timeout=120
-            )
+    with METRICS.measure('clone', processed_url) as sample:
+        for attempt in range(max_retries):
+            try:
+                print(f"      Cloning repository: {processed_url}")
+                if USE_GIT_MIRRORS:
+                    mirror = ensure_mirror(processed_url)
+                    cmd = ['worktree', 'add', '--detach'] + (['--no-checkout'] if partial else [])
+                    with mirror_lock(mirror):
+                        run_git(['worktree', 'prune'], cwd=mirror)
+                        run_git(cmd + [os.path.abspath(save_path), 'HEAD'], cwd=mirror)
+                else:
+                    cmd = ['clone', '--depth', '1']
+                    if blob_filter:
+                        cmd.append(f'--filter={blob_filter}')
+                    if partial:
+                        cmd.append('--no-checkout')
+                    RATE_LIMITER.acquire(processed_url)
+                    run_git(cmd + [processed_url, save_path])
+            
+                if partial:
+                    patterns = list(sparse_paths or ['/*'])
+                    if blob_filter and blob_filter.startswith('blob:limit') and not USE_GIT_MIRRORS:
+                        patterns += ['!' + sparse_pattern_escape(path) for path in missing_blob_paths(save_path)]
+                    if patterns != ['/*']:
+                        run_git(['sparse-checkout', 'set', '--no-cone'] + patterns, cwd=save_path)
+                    run_git(['checkout'], cwd=save_path)
             
-            if result.returncode == 0:
                 print(f"      Repository cloned successfully")
                 return True
-            else:
-                print(f"      [ERROR] Clone failed: {result.stderr.strip()}")
+            except Exception as e:
+                print(f"      [ERROR] Clone failed (attempt {attempt + 1}/{max_retries}): {e}")
+                clear_directory(save_path)
                 if attempt < max_retries - 1:
+                    sample['retries'] += 1
                     time.sleep(2 ** attempt)
                 else:
+                    sample['error'] = error_class(e)
+                    remember_error(repo_url, e)
                     return False
+        return False
+
+def safe_tar_members(tar, dest):
+    """流式遍历归档成员，去掉顶层目录并跳过会写到目标目录之外的条目"""
+    dest = os.path.realpath(dest)
+    for member in tar:
+        parts = member.name.split('/', 1)
+        if len(parts) < 2 or not parts[1]:
+            continue
+        member.name = parts[1]
+        if not (member.isfile() or member.isdir() or member.issym()):
+            continue
+        target = os.path.realpath(os.path.join(dest, member.name))
+        if not target.startswith(dest + os.sep):
+            continue
+        if member.issym():
+            link_target = os.path.realpath(os.path.join(os.path.dirname(target), member.linkname))
+            if not link_target.startswith(dest + os.sep):
+                continue
+        yield member
+
+def download_repository_tarball(repo_url, save_path):
+    """通过共享下载客户端获取 GitHub 默认分支的 tar.gz 快照并边下载边解压
+    
+    归档不可用（非 GitHub 地址或非 200 响应）时返回 False，由调用方回退到 git clone。
+    """
+    processed_url = process_github_url(repo_url)
+    match = re.match(r'https://github\.com/([^/]+/[^/]+?)(?:\.git)?$', processed_url or '')
+    if not match:
+        return False
+    
+    url = CODELOAD_URL.format(repo=match.group(1))
+    tmp_path = save_path + '.tmp'
+    response = None
+    try:
+        print(f"      Downloading code archive: {url}")
+        response = get_download_client().request('GET', url, preload_content=False)
+        if response.status != 200:
+            response.drain_conn()
+            print(f"      [WARN] Code archive unavailable: HTTP {response.status}")
+            return False
+        
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        # 有 extraction filter 的 Python 版本上再叠加 'data' 过滤
+        extract_kwargs = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+        with tarfile.open(fileobj=response, mode='r|gz') as tar:
+            for member in safe_tar_members(tar, tmp_path):
+                tar.extract(member, tmp_path, set_attrs=member.isfile(), **extract_kwargs)
+        
+        if os.path.isdir(save_path) and not os.listdir(save_path):
+            os.rmdir(save_path)
+        os.replace(tmp_path, save_path)
+        print(f"      Code archive extracted successfully")
+        return True
+    except Exception as e:
+        print(f"      [ERROR] Code archive failed: {e}")
+        if response is not None:
+            response.close()
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        return False
+    finally:
+        if response is not None:
+            response.release_conn()
+
+def acquire_code(repo_url, save_path):
+    """按 CODE_BACKEND 获取论文代码，tarball 方式失败时回退到 git clone"""
+    if CODE_BACKEND == 'tarball':
+        if os.path.isdir(save_path) and os.listdir(save_path):
+            print(f"      [INFO] Code already exists: {save_path}")
+            return True
+        if download_repository_tarball(repo_url, save_path):
+            return True
+    return clone_repository(repo_url, save_path)
+
+def repo_head(repo_dir):
+    """本地仓库当前检出的提交，失败时返回 None
+    
+    目录下没有 .git（例如 tarball 方式得到的快照）时返回 None，避免 git 向上找到外层仓库的提交。
+    """
+    if not os.path.exists(os.path.join(repo_dir, '.git')):
+        return None
+    try:
+        return run_git(['rev-parse', 'HEAD'], cwd=repo_dir).strip()
+    except Exception:
+        return None
+
+def remote_head(processed_url):
+    """用 git ls-remote 查询远端默认分支的 HEAD 提交"""
+    RATE_LIMITER.acquire(processed_url)
+    output = run_git(['ls-remote', processed_url, 'HEAD'], timeout=60)
+    return output.split()[0] if output.strip() else None
+
+def update_repository(repo_dir, processed_url=None):
+    """浅拉取远端 HEAD 并快进到最新提交
+    
+    浅历史无法证明新旧提交的祖先关系时，用 reset --keep 切换（保留本地改动）。
+    """
+    if processed_url:
+        RATE_LIMITER.acquire(processed_url)
+    run_git(['fetch', '--depth', '1', 'origin', 'HEAD'], cwd=repo_dir)
+    try:
+        run_git(['merge', '--ff-only', 'FETCH_HEAD'], cwd=repo_dir)
+    except Exception:
+        run_git(['reset', '--keep', 'FETCH_HEAD'], cwd=repo_dir)
+    return repo_head(repo_dir)
+
+def refresh_repositories(state, workers=CLONE_WORKERS):
+    """刷新已克隆的仓库：每个仓库只调用一次 ls-remote，远端 HEAD 未变化的直接跳过"""
+    groups = {}
+    for row in state.cloned_papers():
+        processed_url = process_github_url(row['code_url'])
+        code_dir = paper_paths(row['title'])[2]
+        if processed_url and os.path.exists(os.path.join(code_dir, '.git')):
+            groups.setdefault(processed_url, []).append((row, code_dir))
+    
+    stats = {'repositories': len(groups), 'unchanged': 0, 'updated': 0, 'failed': 0}
+    stats_lock = threading.Lock()
+    
+    def refresh(processed_url, entries):
+        try:
+            head = remote_head(processed_url)
         except Exception as e:
-            print(f"      [ERROR] Clone error (attempt {attempt + 1}/{max_retries}): {e}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)
-            else:
-                return False
-    return False
+            print(f"      [ERROR] ls-remote failed for {processed_url}: {e}")
+            with stats_lock:
+                stats['failed'] += len(entries)
+            return
+        for row, code_dir in entries:
+            if head and head == row['code_head']:
+                with stats_lock:
+                    stats['unchanged'] += 1
+                continue
+            try:
+                if head != repo_head(code_dir):
+                    print(f"      Updating repository: {code_dir}")
+                    update_repository(code_dir, processed_url)
+                state.record_code_head(row['paper_url'], head)
+                with stats_lock:
+                    stats['updated'] += 1
+            except Exception as e:
+                print(f"      [ERROR] Update failed for {code_dir}: {e}")
+                with stats_lock:
+                    stats['failed'] += 1
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(refresh, url, entries) for url, entries in groups.items()]:
+            future.result()
+    return stats
+
+def timed_call(func, *args):
+    """调用 func(*args)，返回 (结果, 耗时秒数)"""
+    start = time.monotonic()
+    result = func(*args)
+    return result, time.monotonic() - start
+
+def clone_repositories(jobs, workers=CLONE_WORKERS):
+    """用 workers 个并行的 git 子进程（或归档下载）获取 [(repo_url, save_path)]，返回对应的 [(结果, 耗时)]"""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(timed_call, acquire_code, repo_url, save_path) for repo_url, save_path in jobs]
+        return [future.result() for future in futures]
 
 def get_paper_details(session, paper_url):
     """获取论文详细信息"""
     try:
-        response = session.get(paper_url, timeout=30)
-        response.raise_for_status()
-        html = etree.HTML(response.content)
+        with METRICS.measure('detail', paper_url) as sample:
+            response = session.get(paper_url, timeout=30)
+            sample['bytes'] = len(response.content)
+            response.raise_for_status()
+        with METRICS.measure('parse', paper_url):
+            html = etree.HTML(response.content)
         
-        # 获取PDF链接
+        # 获取PDF链接：相对链接按详情页地址解析，优先使用 arXiv 链接（abs 页面也可以），统一为规范形式
         pdf_url = None
-        pdf_elements = html.xpath("//a[contains(@href, '.pdf')]/@href")
-        if pdf_elements:
-            pdf_url = pdf_elements[0]
-            if pdf_url.startswith('//'):
-                pdf_url = "https:" + pdf_url
-            elif pdf_url.startswith('/'):
-                pdf_url = "https://arxiv.org" + pdf_url
+        pdf_elements = [urljoin(response.url or paper_url, href) for href in
+                        html.xpath("//a[contains(@href, '.pdf') or contains(@href, 'arxiv.org/abs/')]/@href")]
+        arxiv_links = [href for href in pdf_elements if find_arxiv_id(href)]
+        if arxiv_links:
+            pdf_url = canonical_pdf_url(arxiv_links[0])
+        else:
+            pdf_url = next((href for href in pdf_elements if '.pdf' in href), None)
         
         # 获取代码仓库链接
         code_url = None
@@ -217,109 +1797,1311 @@ def get_paper_details(session, paper_url):
         return pdf_url, code_url
     except Exception as e:
         print(f"      [ERROR] Failed to get paper details: {e}")
+        remember_error(paper_url, e)
         return None, None
 
-def process_paper(session, title, paper_url):
-    """处理单篇论文"""
-    try:
-        print(f"\n    Processing paper: {title}")
-        print(f"      Fetching details from: {paper_url}")
-        
+def paper_paths(title):
+    """根据论文标题生成 (论文目录, PDF路径, 代码目录)"""
+    # 为文件夹和PDF文件使用不同的文件名长度限制
+    folder_name = sanitize_filename(title, max_length=50)
+    pdf_name = sanitize_filename(title, max_length=30)
+    
+    # 确保文件夹名不以点结尾
+    if folder_name.endswith('.'):
+        folder_name = folder_name[:-1]
+    
+    paper_dir = os.path.join(BASE_DOWNLOAD_DIR, folder_name)
+    return paper_dir, os.path.join(paper_dir, f"{pdf_name}.pdf"), os.path.join(paper_dir, "code")
+
+def record_pdf_result(state, paper_url, pdf_url, digest, pdf_path, seconds=None):
+    """把PDF下载结果写入状态库，失败时同时写入重试队列"""
+    state.record_pdf(paper_url, digest, pdf_path, seconds)
+    if digest:
+        state.clear_failure(paper_url, 'pdf')
+    else:
+        state.record_failure(paper_url, 'pdf', take_error(pdf_url) or ('Unknown', ''))
+
+def record_code_result(state, paper_url, code_url, ok, code_dir, seconds=None):
+    """把代码获取结果写入状态库，失败时同时写入重试队列"""
+    state.record_code(paper_url, ok, code_dir, seconds)
+    if ok:
+        state.clear_failure(paper_url, 'code')
+    else:
+        state.record_failure(paper_url, 'code', take_error(code_url) or ('Unknown', ''))
+
+def save_paper(title, pdf_url, code_url, state=None, paper_url=None):
+    """下载论文PDF并克隆代码仓库，已在状态库中完成的部分会被跳过；全部成功时返回 True"""
+    paper_dir, pdf_path, code_dir = paper_paths(title)
+    os.makedirs(paper_dir, exist_ok=True)
+    row = state.get(paper_url) if state else None
+    ok = True
+    
+    if pdf_url:
+        if not (row and row['pdf_status'] == 'done'):
+            start = time.monotonic()
+            digest = download_pdf(pdf_url, pdf_path, state)
+            if state:
+                record_pdf_result(state, paper_url, pdf_url, digest, pdf_path, time.monotonic() - start)
+            ok = ok and bool(digest)
+    else:
+        print("      [WARN] PDF URL not found")
+    
+    if code_url:
+        if not (row and row['code_status'] == 'done'):
+            start = time.monotonic()
+            cloned = acquire_code(code_url, code_dir)
+            if state:
+                record_code_result(state, paper_url, code_url, cloned, code_dir, time.monotonic() - start)
+            ok = ok and cloned
+    else:
+        print("      [INFO] Code URL not found")
+    return ok
+
+def card_links(card):
+    """根据列表页卡片得到 (pdf_url, code_url)，卡片信息不足、仍需请求详情页时返回 None
+    
+    PDF 由 arXiv 编号直接推出；卡片上有仓库链接或明确没有代码时不需要详情页。
+    """
+    if not card or not card['arxiv_id']:
+        return None
+    if card['has_code'] and not card['code_url']:
+        return None
+    return ARXIV_PDF_URL.format(arxiv_id=card['arxiv_id']), card['code_url']
+
+def resolve_paper(session, paper_url, state=None, card=None):
+    """获取论文的 (pdf_url, code_url)
+    
+    状态库中已解析过的论文不再请求详情页；列表页卡片已给出全部链接时也不请求详情页。
+    """
+    row = state.get(paper_url) if state else None
+    if row is not None and row['resolved_at'] is not None:
+        return row['pdf_url'], row['code_url']
+    links = card_links(card)
+    if links:
+        pdf_url, code_url = links
+    else:
         pdf_url, code_url = get_paper_details(session, paper_url)
+        error = take_error(paper_url)
+        if error:
+            if state:
+                state.record_failure(paper_url, 'detail', error)
+            raise Exception(f"Failed to get paper details: {error[1]}")
+        if not pdf_url and card and card['arxiv_id']:
+            pdf_url = ARXIV_PDF_URL.format(arxiv_id=card['arxiv_id'])
+    if state:
+        # 详情页请求失败时上面已抛出异常，这里没有链接说明论文确实没有PDF/代码，同样记录以免每次重新请求
+        state.record_details(paper_url, pdf_url, code_url)
+        state.clear_failure(paper_url, 'detail')
+    return pdf_url, code_url
+
+def process_paper(session, title, paper_url, state=None, listing_page=None, card=None, retry=False):
+    """处理单篇论文；retry 为假时跳过重试队列中未到重试时间或已进入死信列表的论文"""
+    try:
+        if state:
+            if state.is_complete(paper_url):
+                print(f"\n    [INFO] Already completed: {title}")
+                return True
+            if not retry and state.is_deferred(paper_url):
+                print(f"\n    [INFO] Waiting for retry: {title}")
+                return True
+            state.record_listing(paper_url, title, listing_page, card)
         
-        # 为文件夹和PDF文件使用不同的文件名长度限制
-        folder_name = sanitize_filename(title, max_length=50)
-        pdf_name = sanitize_filename(title, max_length=30)
-        
-        # 确保文件夹名不以点结尾
-        if folder_name.endswith('.'):
-            folder_name = folder_name[:-1]
-        
-        paper_dir = os.path.join(BASE_DOWNLOAD_DIR, folder_name)
-        os.makedirs(paper_dir, exist_ok=True)
-        
-        if pdf_url:
-            pdf_path = os.path.join(paper_dir, f"{pdf_name}.pdf")
-            download_file(pdf_url, pdf_path, "PDF")
-        else:
-            print("      [WARN] PDF URL not found")
-        
-        if code_url:
-            code_dir = os.path.join(paper_dir, "code")
-            clone_repository(code_url, code_dir)
-        else:
-            print("      [INFO] Code URL not found")
+        print(f"\n    Processing paper: {title}")
+        if not card_links(card):
+            print(f"      Fetching details from: {paper_url}")
         
-        return True
+        pdf_url, code_url = resolve_paper(session, paper_url, state, card)
+        if not PAPER_FILTER.match_code(code_url):
+            print("      [INFO] No code found, skipped by filter")
+            return True
+        return save_paper(title, pdf_url, code_url, state, paper_url)
     except Exception as e:
         print(f"      [ERROR] Failed to process paper: {e}")
         return False
 
-def get_papers_from_page(session, page_num):
+def task_slug(base_url):
+    """从任务列表页地址中取出任务名"""
+    return urlparse(base_url).path.rstrip('/').rsplit('/', 1)[-1]
+
+def link_task_paper(task, title):
+    """在 tasks/<任务名>/ 下创建指向共享论文目录的相对符号链接"""
+    paper_dir = paper_paths(title)[0]
+    task_dir = os.path.join(BASE_DOWNLOAD_DIR, "tasks", task)
+    link_path = os.path.join(task_dir, os.path.basename(paper_dir))
+    if os.path.lexists(link_path):
+        return
+    os.makedirs(task_dir, exist_ok=True)
+    try:
+        os.symlink(os.path.relpath(paper_dir, task_dir), link_path, target_is_directory=True)
+    except OSError as e:
+        print(f"      [WARN] Failed to link {title} into task {task}: {e}")
+
+def record_listing_paper(state, base_url, title, paper_url, page_num):
+    """记录列表页上出现的论文及其所属任务，多任务模式下同时创建任务目录中的链接"""
+    task = task_slug(base_url or BASE_URL)
+    if state:
+        state.record_task(task, paper_url)
+    if LINK_TASK_FOLDERS:
+        link_task_paper(task, title)
+
+def fetch_listing_page(session, page_num, base_url=None):
+    """请求并解析一个列表页；超出范围的页（HTTP 404）返回空列表，其他失败抛出异常"""
+    url = f"{base_url or BASE_URL}?page={page_num}"
+    print(f"\n  Fetching page {page_num}: {url}")
+    
+    with METRICS.measure('listing', url) as sample:
+        response = session.get(url, timeout=30)
+        sample['bytes'] = len(response.content)
+        if response.status_code == 404:
+            return []
+        response.raise_for_status()
+    with METRICS.measure('parse', url):
+        return parse_papers(response.content, url)
+
+def get_papers_from_page(session, page_num, base_url=None):
     """获取页面上的论文列表"""
     try:
-        url = f"{BASE_URL}?page={page_num}"
+        return fetch_listing_page(session, page_num, base_url)
+    except Exception as e:
+        print(f"  [ERROR] Failed to fetch page {page_num}: {e}")
+        return []
+
+def find_last_page(session, base_url=None, max_pages=MAX_PAGES, pages=None):
+    """用指数探测（1, 2, 4, 8…）加二分查找确定列表的最后一页，没有任何论文时返回 0
+    
+    探测过的页面内容存入 pages（页码 -> 论文列表），正式抓取时直接使用，不再重复请求。
+    任何探测请求失败时返回 None，由调用方退回逐页探测。
+    """
+    pages = {} if pages is None else pages
+    
+    def has_papers(page_num):
+        if page_num not in pages:
+            pages[page_num] = fetch_listing_page(session, page_num, base_url)
+        return bool(pages[page_num])
+    
+    try:
+        if not has_papers(1):
+            return 0
+        # 指数探测：lo 为已知有论文的页，hi 为已知为空的页
+        lo, hi = 1, None
+        while hi is None:
+            probe = min(lo * 2, max_pages)
+            if probe == lo:
+                return lo
+            if has_papers(probe):
+                lo = probe
+            else:
+                hi = probe
+        while hi - lo > 1:
+            middle = (lo + hi) // 2
+            if has_papers(middle):
+                lo = middle
+            else:
+                hi = middle
+        print(f"\n  [INFO] Last listing page: {lo} (found with {len(pages)} requests)")
+        return lo
+    except Exception as e:
+        print(f"  [WARN] Failed to find the last listing page, probing page by page: {e}")
+        return None
+
+def iter_listing_pages_sync(session, base_url=None, max_pages=MAX_PAGES, prefetch=None):
+    """按页码顺序产出 (page_num, papers)，处理当前页时在后台线程中预取后续页面
+    
+    先确定最后一页，列表页地址全部已知后按 prefetch 大小的窗口提前请求；
+    无法确定最后一页时逐页请求，连续 3 个空页或达到 max_pages 时停止。
+    """
+    prefetch = prefetch or LISTING_PREFETCH
+    pages = {}
+    last_page = find_last_page(session, base_url, max_pages, pages)
+    if last_page is None:
+        consecutive_empty_pages = 0
+        for page_num in range(1, max_pages + 1):
+            papers = get_papers_from_page(session, page_num, base_url)
+            yield page_num, papers
+            consecutive_empty_pages = 0 if papers else consecutive_empty_pages + 1
+            if consecutive_empty_pages >= 3:
+                print("\n  No new papers found for 3 consecutive pages. Stopping.")
+                return
+        print("\n  [WARN] Reached maximum page limit. Stopping.")
+        return
+    
+    pending = deque()
+    next_page = 1
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        try:
+            while next_page <= last_page or pending:
+                while next_page <= last_page and len(pending) < prefetch:
+                    if next_page in pages:
+                        pending.append((next_page, None))
+                    else:
+                        pending.append((next_page, executor.submit(get_papers_from_page, session, next_page,
+                                                                   base_url)))
+                    next_page += 1
+                page_num, future = pending.popleft()
+                yield page_num, pages.pop(page_num) if future is None else future.result()
+        finally:
+            for _, future in pending:
+                if future is not None:
+                    future.cancel()
+
+def find_arxiv_id(text):
+    """从链接或缩略图地址中提取 arXiv 编号（新格式 YYMM.NNNNN 或旧格式 subject/YYMMNNN）"""
+    match = re.search(r'arxiv\.org/(?:abs|pdf)/([\w.-]+/\d{7}|\d{4}\.\d{4,5})(?:v\d+)?', text)
+    if not match:
+        match = re.search(r'/thumbnails/papers?/(\d{4}\.\d{4,5})(?:v\d+)?\.\w+', text)
+    return match.group(1) if match else None
+
+def parse_stars(text):
+    """解析卡片上的星标数，支持 "1,234" 和 "1.2k" 形式"""
+    match = re.search(r'(\d[\d,]*(?:\.\d+)?)\s*([kK])?', text or '')
+    if not match:
+        return None
+    value = float(match.group(1).replace(',', ''))
+    return int(value * 1000) if match.group(2) else int(value)
+
+def parse_card_date(text):
+    """把卡片上的发布日期（如 "1 Feb 2023"）转换为 YYYY-MM-DD，无法识别时保留原文"""
+    text = (text or '').strip()
+    if not text:
+        return None
+    for fmt in ("%d %b %Y", "%d %B %Y", "%b %d, %Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return text
+
+def parse_paper_card(element, page_url):
+    """解析一张论文卡片：标题、链接、arXiv 编号、日期、星标数、代码仓库和框架标记"""
+    title_element = element.xpath(".//h1/a | .//h5/a")[0]
+    hrefs = element.xpath(".//a/@href")
+    images = ' '.join(element.xpath(".//@style | .//img/@src"))
+    
+    arxiv_id = None
+    for text in hrefs + [images]:
+        arxiv_id = find_arxiv_id(text)
+        if arxiv_id:
+            break
+    
+    code_url = next((href for href in hrefs if 'github.com' in href), None)
+    frameworks = []
+    for img in element.xpath(".//img[contains(@src, 'framework')]"):
+        name = img.get('title') or img.get('alt') or os.path.splitext(os.path.basename(img.get('src')))[0]
+        if name and name.lower() not in frameworks:
+            frameworks.append(name.lower())
+    
+    return {
+        'title': title_element.text.strip(),
+        'paper_url': urljoin(page_url, title_element.get('href')),
+        'arxiv_id': arxiv_id,
+        'date': parse_card_date(''.join(element.xpath(".//*[contains(@class, 'item-date-pub')]//text()"))),
+        'stars': parse_stars(''.join(element.xpath(".//*[contains(@class, 'entity-stars')]//text()"))),
+        'code_url': code_url,
+        'has_code': bool(code_url) or any(href.endswith('#code') for href in hrefs),
+        'frameworks': frameworks,
+    }
+
+def parse_papers(content, page_url=None):
+    """从列表页HTML中解析论文卡片列表，每张卡片为 parse_paper_card 返回的字典，链接相对 page_url 解析"""
+    html = etree.HTML(content)
+    
+    papers = []
+    paper_elements = html.xpath("//div[contains(@class, 'paper-card')]")
+    
+    for element in paper_elements:
+        try:
+            papers.append(parse_paper_card(element, page_url or BASE_URL))
+        except Exception as e:
+            print(f"      [ERROR] Failed to parse paper element: {e}")
+            continue
+    
+    return papers
+
+class PaperFilter:
+    """论文筛选条件：发布日期范围、最少星标数、必须有代码、标题正则、跳过已属于其他任务的论文
+    
+    每个条件在最早能确定其字段的阶段求值：列表页卡片（或导出文件）上已有的字段在排队前判断，
+    是否有代码在卡片上无法确定时到解析出仓库链接后再判断。被筛除的论文不会产生详情请求、PDF下载或克隆。
+    日期或星标数未知的论文视为不满足对应条件。
+    """
+    
+    def __init__(self, since=None, until=None, min_stars=None, has_code=False, title_pattern=None,
+                 skip_other_tasks=False):
+        self.since = self._normalize_date(since, '01-01')
+        self.until = self._normalize_date(until, '12-31')
+        self.min_stars = min_stars
+        self.has_code = has_code
+        self.title_pattern = re.compile(title_pattern, re.IGNORECASE) if title_pattern else None
+        self.skip_other_tasks = skip_other_tasks
+    
+    @staticmethod
+    def _normalize_date(value, year_suffix):
+        """把 YYYY 或 YYYY-MM 补全为 YYYY-MM-DD，便于按字符串比较"""
+        if not value:
+            return None
+        if re.fullmatch(r'\d{4}', value):
+            return f"{value}-{year_suffix}"
+        if re.fullmatch(r'\d{4}-\d{2}', value):
+            return f"{value}-{'01' if year_suffix == '01-01' else '31'}"
+        return value
+    
+    @property
+    def enabled(self):
+        return any((self.since, self.until, self.min_stars is not None, self.has_code, self.title_pattern,
+                    self.skip_other_tasks))
+    
+    def match_card(self, card, state=None, task=None):
+        """用列表页卡片上的字段判断论文是否保留，has_code 为 None 表示未知，留到 match_code 判断"""
+        if not self.enabled:
+            return True
+        if self.title_pattern and not self.title_pattern.search(card.get('title') or ''):
+            return False
+        if self.since or self.until:
+            date = card.get('date')
+            if not date or not re.match(r'\d{4}-\d{2}-\d{2}$', date):
+                return False
+            if (self.since and date < self.since) or (self.until and date > self.until):
+                return False
+        if self.min_stars is not None and (card.get('stars') or 0) < self.min_stars:
+            return False
+        if self.has_code and card.get('has_code') is False:
+            return False
+        if self.skip_other_tasks and state and any(other != task for other in state.tasks_for(card['paper_url'])):
+            return False
+        return True
+    
+    def match_code(self, code_url):
+        """解析出代码链接后判断 has_code 条件"""
+        return not self.has_code or bool(code_url)
+
+# 命令行指定的筛选条件，默认不筛选
+PAPER_FILTER = PaperFilter()
+
+def get_papers_from_page_conditional(session, page_num, state, base_url=None):
+    """带 ETag / If-Modified-Since 的条件请求列表页
+    
+    返回 (papers, validators)。页面自上次抓取后未变化（HTTP 304）时 papers 为 None，
+    请求失败时为空列表。validators 需在该页论文处理完后再写回状态库。
+    """
+    url = f"{base_url or BASE_URL}?page={page_num}"
+    headers = {}
+    etag, last_modified = state.get_page_validators(url)
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    
+    try:
         print(f"\n  Fetching page {page_num}: {url}")
-        
-        response = session.get(url, timeout=30)
+        with METRICS.measure('listing', url) as sample:
+            response = session.get(url, headers=headers, timeout=30)
+            sample['bytes'] = len(response.content)
+            if response.status_code >= 400:
+                sample['error'] = f"HTTP{response.status_code}"
+        if response.status_code == 304:
+            print(f"  [INFO] Page {page_num} not modified since last crawl")
+            return None, None
         response.raise_for_status()
-        html = etree.HTML(response.content)
-        
-        papers = []
-        paper_elements = html.xpath("//div[contains(@class, 'paper-card')]")
-        
-        for element in paper_elements:
+        validators = (url, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        with METRICS.measure('parse', url):
+            return parse_papers(response.content, url), validators
+    except Exception as e:
+        print(f"  [ERROR] Failed to fetch page {page_num}: {e}")
+        return [], None
+
+# 每个主机一个信号量，限制同一主机上的并发请求数
+_host_semaphores = {}
+
+def host_semaphore(url, concurrency):
+    """获取URL所属主机的并发信号量"""
+    # 信号量绑定在事件循环上，按 (循环, 主机) 区分
+    key = (id(asyncio.get_running_loop()), urlparse(url).netloc)
+    if key not in _host_semaphores:
+        _host_semaphores[key] = asyncio.Semaphore(concurrency)
+    return _host_semaphores[key]
+
+async def fetch_page_async(session, page_num, concurrency, base_url=None):
+    """在线程池中异步获取列表页"""
+    async with host_semaphore(base_url or BASE_URL, concurrency):
+        return await asyncio.to_thread(get_papers_from_page, session, page_num, base_url)
+
+async def fetch_details_async(session, paper_url, concurrency, state=None, card=None):
+    """在线程池中异步获取论文详情，卡片已给出全部链接时不占用主机并发名额"""
+    if card_links(card):
+        return await asyncio.to_thread(resolve_paper, session, paper_url, state, card)
+    async with host_semaphore(paper_url, concurrency):
+        return await asyncio.to_thread(resolve_paper, session, paper_url, state, card)
+
+async def iter_listing_pages(session, concurrency=DEFAULT_CONCURRENCY, max_pages=MAX_PAGES, base_url=None,
+                             prefetch=None):
+    """按页码顺序依次产出 (page_num, papers)
+    
+    先确定最后一页，再以 prefetch 大小的滑动窗口并发请求后续页面，不必等一批页面全部返回；
+    无法确定最后一页时按并发窗口逐批请求，连续 3 个空页或达到 max_pages 时停止。
+    """
+    prefetch = prefetch or LISTING_PREFETCH
+    pages = {}
+    last_page = await asyncio.to_thread(find_last_page, session, base_url, max_pages, pages)
+    if last_page is not None:
+        pending = deque()
+        next_page = 1
+        try:
+            while next_page <= last_page or pending:
+                while next_page <= last_page and len(pending) < prefetch:
+                    if next_page in pages:
+                        pending.append((next_page, None))
+                    else:
+                        pending.append((next_page, asyncio.create_task(
+                            fetch_page_async(session, next_page, concurrency, base_url))))
+                    next_page += 1
+                page_num, task = pending.popleft()
+                yield page_num, pages.pop(page_num) if task is None else await task
+        finally:
+            for _, task in pending:
+                if task is not None:
+                    task.cancel()
+        return
+    
+    page_num = 1
+    consecutive_empty_pages = 0
+    while page_num <= max_pages:
+        window = range(page_num, min(page_num + concurrency, max_pages + 1))
+        results = await asyncio.gather(*(fetch_page_async(session, n, concurrency, base_url) for n in window))
+        for n, papers in zip(window, results):
+            yield n, papers
+            if not papers:
+                consecutive_empty_pages += 1
+                if consecutive_empty_pages >= 3:
+                    print("\n  No new papers found for 3 consecutive pages. Stopping.")
+                    return
+            else:
+                consecutive_empty_pages = 0
+        page_num = window[-1] + 1
+    print("\n  [WARN] Reached maximum page limit. Stopping.")
+
+async def crawl_async(session, concurrency=DEFAULT_CONCURRENCY, max_pages=MAX_PAGES, state=None,
+                      base_urls=None):
+    """并发抓取列表页和详情页，返回 [(title, paper_url, pdf_url, code_url)]
+    
+    多个任务的列表页共用同一组主机并发限制交替抓取，同一篇论文只解析一次。
+    状态库中已完成的论文不会出现在结果中。
+    """
+    seen_urls = set()
+    detail_tasks = []
+    
+    async def resolve(title, paper_url, card):
+        try:
+            pdf_url, code_url = await fetch_details_async(session, paper_url, concurrency, state, card)
+        except Exception as e:
+            print(f"      [ERROR] Failed to process paper: {e}")
+            return None
+        return title, paper_url, pdf_url, code_url
+    
+    async def consume_listing(base_url):
+        task = task_slug(base_url or BASE_URL)
+        async for page_num, papers in iter_listing_pages(session, concurrency, max_pages, base_url):
+            for card in papers:
+                title, paper_url = card['title'], card['paper_url']
+                if not PAPER_FILTER.match_card(card, state, task):
+                    continue
+                record_listing_paper(state, base_url, title, paper_url, page_num)
+                if paper_url in seen_urls:
+                    continue
+                seen_urls.add(paper_url)
+                if state:
+                    if state.is_complete(paper_url) or state.is_deferred(paper_url):
+                        continue
+                    state.record_listing(paper_url, title, page_num, card)
+                detail_tasks.append(asyncio.create_task(resolve(title, paper_url, card)))
+            print(f"\n  Page {page_num} queued. Total unique papers: {len(seen_urls)}")
+    
+    await asyncio.gather(*(consume_listing(base_url) for base_url in base_urls or [BASE_URL]))
+    records = await asyncio.gather(*detail_tasks)
+    return [record for record in records if record and PAPER_FILTER.match_code(record[3])]
+
+async def run_pipeline(session, concurrency=DEFAULT_CONCURRENCY, detail_workers=DETAIL_WORKERS,
+                       pdf_workers=PDF_WORKERS, clone_workers=CLONE_WORKERS, queue_size=QUEUE_SIZE,
+                       report_interval=REPORT_INTERVAL, state=None, base_urls=None):
+    """分阶段流水线：列表页 -> 详情解析 -> PDF下载 -> 仓库克隆
+    
+    每个阶段有独立的有界队列和工作者池，队列满时上游阻塞（反压）。
+    多个任务的列表页并行进入同一个详情队列，同一篇论文只处理一次。
+    HTTP阶段共用网络线程池，克隆阶段使用独立的线程池，慢克隆不会占用下载线程。
+    """
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency + detail_workers + pdf_workers))
+    git_executor = ThreadPoolExecutor(max_workers=clone_workers)
+    
+    detail_queue = asyncio.Queue(queue_size)
+    pdf_queue = asyncio.Queue(queue_size)
+    clone_queue = asyncio.Queue(max(queue_size, CLONE_QUEUE_SIZE))
+    stats = {'papers': 0, 'pdfs': 0, 'clones': 0, 'failed': 0, 'skipped': 0, 'filtered': 0}
+    
+    seen_urls = set()
+    
+    async def listing_stage(base_url):
+        task = task_slug(base_url or BASE_URL)
+        async for page_num, papers in iter_listing_pages(session, concurrency, base_url=base_url):
+            for card in papers:
+                title, paper_url = card['title'], card['paper_url']
+                if not PAPER_FILTER.match_card(card, state, task):
+                    stats['filtered'] += 1
+                    continue
+                record_listing_paper(state, base_url, title, paper_url, page_num)
+                if paper_url in seen_urls:
+                    continue
+                seen_urls.add(paper_url)
+                if state:
+                    if state.is_complete(paper_url) or state.is_deferred(paper_url):
+                        stats['skipped'] += 1
+                        continue
+                    state.record_listing(paper_url, title, page_num, card)
+                await detail_queue.put(card)
+    
+    async def detail_worker():
+        while True:
+            card = await detail_queue.get()
+            title, paper_url = card['title'], card['paper_url']
+            try:
+                pdf_url, code_url = await fetch_details_async(session, paper_url, concurrency, state, card)
+                if not PAPER_FILTER.match_code(code_url):
+                    stats['filtered'] += 1
+                    continue
+                row = state.get(paper_url) if state else None
+                paper_dir, pdf_path, code_dir = paper_paths(title)
+                os.makedirs(paper_dir, exist_ok=True)
+                if not pdf_url:
+                    print(f"      [WARN] PDF URL not found: {title}")
+                elif not (row and row['pdf_status'] == 'done'):
+                    await pdf_queue.put((paper_url, pdf_url, pdf_path))
+                if code_url and not (row and row['code_status'] == 'done'):
+                    await clone_queue.put((paper_url, code_url, code_dir))
+                stats['papers'] += 1
+            except Exception as e:
+                stats['failed'] += 1
+                print(f"      [ERROR] Failed to process paper: {e}")
+            finally:
+                detail_queue.task_done()
+    
+    async def pdf_worker():
+        while True:
+            paper_url, pdf_url, pdf_path = await pdf_queue.get()
+            try:
+                start = time.monotonic()
+                digest = await asyncio.to_thread(download_pdf, pdf_url, pdf_path, state)
+                if state:
+                    await asyncio.to_thread(record_pdf_result, state, paper_url, pdf_url, digest, pdf_path,
+                                            time.monotonic() - start)
+                if digest:
+                    stats['pdfs'] += 1
+            except Exception as e:
+                stats['failed'] += 1
+                print(f"      [ERROR] Failed to download PDF: {e}")
+            finally:
+                pdf_queue.task_done()
+    
+    async def clone_worker():
+        while True:
+            paper_url, code_url, code_dir = await clone_queue.get()
             try:
-                title_element = element.xpath(".//h1/a | .//h5/a")[0]
-                title = title_element.text.strip()
-                paper_url = "https://paperswithcode.com" + title_element.get('href')
-                papers.append((title, paper_url))
+                ok, seconds = await loop.run_in_executor(git_executor, timed_call, acquire_code, code_url, code_dir)
+                if state:
+                    await loop.run_in_executor(git_executor, record_code_result, state, paper_url, code_url, ok,
+                                               code_dir, seconds)
+                if ok:
+                    stats['clones'] += 1
             except Exception as e:
-                print(f"      [ERROR] Failed to parse paper element: {e}")
+                stats['failed'] += 1
+                print(f"      [ERROR] Failed to fetch code: {e}")
+            finally:
+                clone_queue.task_done()
+    
+    async def reporter():
+        while True:
+            await asyncio.sleep(report_interval)
+            print(f"\n  [PIPELINE] queue depth: detail={detail_queue.qsize()} pdf={pdf_queue.qsize()} "
+                  f"clone={clone_queue.qsize()} | done: papers={stats['papers']} pdfs={stats['pdfs']} "
+                  f"clones={stats['clones']}")
+    
+    workers = [asyncio.create_task(reporter())]
+    workers += [asyncio.create_task(detail_worker()) for _ in range(detail_workers)]
+    workers += [asyncio.create_task(pdf_worker()) for _ in range(pdf_workers)]
+    workers += [asyncio.create_task(clone_worker()) for _ in range(clone_workers)]
+    
+    try:
+        await asyncio.gather(*(listing_stage(base_url) for base_url in base_urls or [BASE_URL]))
+        # 按阶段顺序等待队列清空，保证上游不会再产生新任务
+        for stage_queue in (detail_queue, pdf_queue, clone_queue):
+            await stage_queue.join()
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        git_executor.shutdown(wait=False)
+    
+    return stats
+
+def crawl_serial(session, state=None, base_url=None, prefetch=None):
+    """逐页逐篇顺序抓取，后续列表页在处理当前页的论文时预取"""
+    processed_urls = set()
+    # 本次已经处理过（无论成败）的论文；失败的论文已进入重试队列，不影响是否继续翻页
+    seen_urls = set()
+    
+    for page_num, papers in iter_listing_pages_sync(session, base_url, prefetch=prefetch):
+        if not papers:
+            continue
+        new_cards = 0
+        
+        for card in papers:
+            title, paper_url = card['title'], card['paper_url']
+            if paper_url in seen_urls:
                 continue
+            seen_urls.add(paper_url)
+            new_cards += 1
+            if not PAPER_FILTER.match_card(card, state, task_slug(base_url or BASE_URL)):
+                continue
+            record_listing_paper(state, base_url, title, paper_url, page_num)
+            if process_paper(session, title, paper_url, state, page_num, card):
+                processed_urls.add(paper_url)
         
-        return papers
-    except Exception as e:
-        print(f"  [ERROR] Failed to fetch page {page_num}: {e}")
-        return []
+        if new_cards == 0:
+            print("\n  All papers on this page were already processed. Stopping.")
+            break
+        
+        print(f"\n  Page {page_num} completed. Total unique papers: {len(processed_urls)}")
+    
+    return len(processed_urls)
 
-if __name__ == '__main__':
-    os.makedirs(BASE_DOWNLOAD_DIR, exist_ok=True)
-    session = create_session(use_proxy=True)
+def crawl_incremental(session, state, base_url=None):
+    """增量抓取：按从新到旧的列表顺序处理新论文，遇到上次完整增量抓取已覆盖的论文即停止
     
+    高水位（本次开始时第一页上的论文）和列表页校验头只在本次抓取正常结束后保存，
+    中断的抓取不会让下次运行提前停止或因 304 跳过未处理的论文。
+    """
+    task = task_slug(base_url or BASE_URL)
+    covered = state.get_incremental_mark(task)
+    head_urls = None
+    page_validators = []
     page_num = 1
-    processed_titles = set()
+    new_papers = 0
     consecutive_empty_pages = 0
     
-    while True:
-        papers = get_papers_from_page(session, page_num)
-        
+    while page_num <= MAX_PAGES:
+        papers, validators = get_papers_from_page_conditional(session, page_num, state, base_url)
+        if papers is None:
+            break
         if not papers:
             consecutive_empty_pages += 1
             if consecutive_empty_pages >= 3:
                 print("\n  No new papers found for 3 consecutive pages. Stopping.")
                 break
-        else:
-            consecutive_empty_pages = 0
-            new_papers = 0
-            
-            for title, paper_url in papers:
-                if title not in processed_titles:
-                    if process_paper(session, title, paper_url):
-                        processed_titles.add(title)
-                        new_papers += 1
-                time.sleep(1)
-            
-            if new_papers == 0 and papers:
-                print("\n  All papers on this page were already processed. Stopping.")
+            page_num += 1
+            continue
+        consecutive_empty_pages = 0
+        
+        if head_urls is None:
+            head_urls = [card['paper_url'] for card in papers]
+        reached_known = False
+        for card in papers:
+            title, paper_url = card['title'], card['paper_url']
+            if paper_url in covered:
+                reached_known = True
                 break
+            if not PAPER_FILTER.match_card(card, state, task):
+                continue
+            record_listing_paper(state, base_url, title, paper_url, page_num)
+            if process_paper(session, title, paper_url, state, page_num, card):
+                new_papers += 1
         
-        print(f"\n  Page {page_num} completed. Total unique papers: {len(processed_titles)}")
+        if validators:
+            page_validators.append(validators)
+        if reached_known:
+            print(f"\n  Reached previously crawled papers on page {page_num}. Stopping.")
+            break
         page_num += 1
-        time.sleep(2)
+    
+    for validators in page_validators:
+        state.save_page_validators(*validators)
+    if head_urls:
+        state.save_incremental_mark(task, head_urls)
+    return new_papers
+
+def retry_failures(session, state, include_dead=False):
+    """重试队列：只重新处理已到重试时间的失败论文，已完成的阶段不再请求
+    
+    include_dead 为真时同时取回死信列表中的论文并重新开始计数。返回本次恢复成功的论文数。
+    """
+    paper_urls = state.due_failures(include_dead)
+    print(f"\n  Retrying {len(paper_urls)} failed papers")
+    recovered = 0
+    for paper_url in paper_urls:
+        if include_dead:
+            state.reset_failures(paper_url)
+        row = state.get(paper_url)
+        title = row['title'] if row and row['title'] else paper_url
+        if process_paper(session, title, paper_url, state, row['listing_page'] if row else None, retry=True):
+            recovered += 1
+    
+    waiting = state.failures(dead=False)
+    dead = state.failures(dead=True)
+    print(f"\n  Recovered {recovered} papers, {len(waiting)} failures waiting for retry, {len(dead)} dead letters")
+    for failure in dead:
+        print(f"  [DEAD] {failure['stage']} {failure['error']} after {failure['attempts']} attempts: "
+              f"{failure['title'] or failure['paper_url']} ({failure['message'][:120]})")
+    return recovered
+
+def download_records(records, state=None, clone_workers=CLONE_WORKERS):
+    """下载已解析的 [(title, paper_url, pdf_url, code_url)]：逐篇下载PDF，同时并行克隆代码仓库"""
+    clone_jobs = []
+    for title, paper_url, pdf_url, code_url in records:
+        print(f"\n    Processing paper: {title}")
+        try:
+            save_paper(title, pdf_url, None, state, paper_url)
+            row = state.get(paper_url) if state else None
+            if code_url and not (row and row['code_status'] == 'done'):
+                clone_jobs.append((paper_url, code_url, paper_paths(title)[2]))
+        except Exception as e:
+            print(f"      [ERROR] Failed to process paper: {e}")
+    
+    results = clone_repositories([(code_url, code_dir) for _, code_url, code_dir in clone_jobs], clone_workers)
+    if state:
+        for (paper_url, code_url, code_dir), (ok, seconds) in zip(clone_jobs, results):
+            record_code_result(state, paper_url, code_url, ok, code_dir, seconds)
+    return len(records)
+
+def crawl_with_async_engine(session, concurrency, state=None, clone_workers=CLONE_WORKERS, base_urls=None):
+    """异步解析全部论文后下载PDF，同时在并行的 git 子进程中克隆代码仓库"""
+    records = asyncio.run(crawl_async(session, concurrency, state=state, base_urls=base_urls))
+    return download_records(records, state, clone_workers)
+
+def iter_json_records(path, chunk_size=1024*1024):
+    """流式读取（可gzip压缩的）JSON数组或JSON Lines文件，逐个产出对象，不把整个文件读入内存"""
+    opener = gzip.open if path.endswith('.gz') else open
+    decoder = json.JSONDecoder()
+    # 数组的括号、分隔符和空白
+    separators = re.compile(r'[\s\[\],]*')
+    with opener(path, 'rt', encoding='utf-8') as f:
+        buffer = ''
+        pos = 0
+        eof = False
+        while True:
+            pos = separators.match(buffer, pos).end()
+            if pos == len(buffer):
+                if eof:
+                    return
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer, pos = chunk, 0
+                continue
+            try:
+                obj, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # 对象被截断在缓冲区末尾，继续读入
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            yield obj
+
+def slugify_task(name):
+    """任务名转为列表页地址中的形式，如 Time Series Anomaly Detection -> time-series-anomaly-detection"""
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+
+def iter_dump_papers(papers_path, links_path=None, task_slugs=None, paper_filter=None):
+    """从 Papers with Code 导出的 JSON 文件中解析论文，产出 (title, paper_url, pdf_url, code_url, tasks)
+    
+    先流式扫描 papers-with-abstracts 按任务筛选，再流式扫描 links-between-papers-and-code
+    为命中的论文选取代码仓库（优先官方实现），内存占用只与命中的论文数量有关。
+    paper_filter 的标题和日期条件在第一遍扫描时判断，是否有代码在选出仓库后判断；导出文件中没有星标数。
+    """
+    wanted = set(task_slugs or [])
+    papers = {}
+    for record in iter_json_records(papers_path):
+        paper_url = record.get('paper_url')
+        tasks = [slugify_task(task) for task in record.get('tasks') or []]
+        if not paper_url or (wanted and not wanted.intersection(tasks)):
+            continue
+        card = {'title': record.get('title'), 'paper_url': paper_url, 'date': record.get('date'),
+                'stars': None, 'has_code': None}
+        if paper_filter and not paper_filter.match_card(card):
+            continue
+        pdf_url = record.get('url_pdf')
+        if not pdf_url and record.get('arxiv_id'):
+            pdf_url = ARXIV_PDF_URL.format(arxiv_id=record['arxiv_id'])
+        pdf_url = canonical_pdf_url(pdf_url)
+        papers[paper_url] = [record.get('title'), pdf_url, None, False, sorted(wanted.intersection(tasks))]
+    
+    if links_path:
+        for link in iter_json_records(links_path):
+            entry = papers.get(link.get('paper_url'))
+            if entry is None or not link.get('repo_url'):
+                continue
+            official = bool(link.get('is_official'))
+            if entry[2] is None or (official and not entry[3]):
+                entry[2], entry[3] = link['repo_url'], official
+    
+    for paper_url, (title, pdf_url, code_url, _, tasks) in papers.items():
+        if paper_filter and not paper_filter.match_code(code_url):
+            continue
+        yield title, paper_url, pdf_url, code_url, tasks
+
+def crawl_from_dump(papers_path, links_path=None, task_slugs=None, state=None, clone_workers=CLONE_WORKERS):
+    """用导出的 JSON 文件代替列表页和详情页抓取，直接下载命中的论文"""
+    records = []
+    for title, paper_url, pdf_url, code_url, tasks in iter_dump_papers(papers_path, links_path, task_slugs,
+                                                                        PAPER_FILTER):
+        if PAPER_FILTER.skip_other_tasks and state and set(state.tasks_for(paper_url)) - set(tasks):
+            continue
+        for task in tasks:
+            if state:
+                state.record_task(task, paper_url)
+            if LINK_TASK_FOLDERS:
+                link_task_paper(task, title)
+        if state:
+            if state.is_complete(paper_url) or state.is_deferred(paper_url):
+                continue
+            state.record_listing(paper_url, title)
+            state.record_details(paper_url, pdf_url, code_url)
+        records.append((title, paper_url, pdf_url, code_url))
+    print(f"\n  Resolved {len(records)} papers from {os.path.basename(papers_path)}")
+    return download_records(records, state, clone_workers)
+
+def crawl_with_pipeline(session, args, state=None, base_urls=None):
+    """以分阶段流水线方式抓取和下载"""
+    stats = asyncio.run(run_pipeline(
+        session,
+        concurrency=args.concurrency,
+        detail_workers=args.detail_workers,
+        pdf_workers=args.pdf_workers,
+        clone_workers=args.clone_workers,
+        queue_size=args.queue_size,
+        state=state,
+        base_urls=base_urls,
+    ))
+    print(f"\n  Pipeline finished: {stats['pdfs']} PDFs, {stats['clones']} repositories, "
+          f"{stats['skipped']} already completed, {stats['filtered']} filtered out, {stats['failed']} failed")
+    return stats['papers']
+
+def hash_point(key):
+    """键在一致性哈希环上的位置（56位整数，可直接存入 SQLite）"""
+    return int.from_bytes(hashlib.sha1(key.encode('utf-8')).digest()[:7], 'big')
+
+def shard_ranges(shard, shards, vnodes=SHARD_VNODES):
+    """分片在哈希环上负责的区间列表 [(start, end)]，区间为左开右闭
+    
+    每个分片在环上有 vnodes 个虚拟节点，节点负责从前一个节点到自身的区间。
+    分片数变化时只有相邻区间的论文改变归属，已入队的论文不需要重新分配。
+    """
+    ring = sorted((hash_point(f"shard-{s}-{v}"), s) for s in range(shards) for v in range(vnodes))
+    points = [point for point, _ in ring]
+    ranges = []
+    for i, (point, owner) in enumerate(ring):
+        if owner != shard:
+            continue
+        if i == 0:
+            # 环的起点：负责最后一个节点之后和第一个节点之前的两段
+            ranges.append((points[-1], 1 << 56))
+            ranges.append((-1, point))
+        else:
+            ranges.append((points[i - 1], point))
+    return ranges
+
+class WorkQueue:
+    """多台机器共享的工作队列，保存在（可位于共享文件系统上的）SQLite 数据库中
+    
+    每篇论文一行，按论文URL的哈希值落在环上的位置分配给分片。工作者以租约方式领取论文，
+    租约过期（工作者崩溃）后论文可以被重新领取。领取使用 BEGIN IMMEDIATE 加写锁，
+    多个进程不会领到同一篇论文。共享文件系统上不使用 WAL，依赖 SQLite 的文件锁。
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS work_queue (
+            paper_url TEXT PRIMARY KEY,
+            title TEXT,
+            task TEXT,
+            listing_page INTEGER,
+            card TEXT,
+            ring_point INTEGER,
+            status TEXT DEFAULT 'pending',
+            worker TEXT,
+            lease_expires REAL,
+            attempts INTEGER DEFAULT 0,
+            pdf_status TEXT,
+            code_status TEXT,
+            updated_at REAL
+        )
+    """
+    INDEX = "CREATE INDEX IF NOT EXISTS work_queue_ring ON work_queue (status, ring_point)"
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute(self.SCHEMA)
+        self.conn.execute(self.INDEX)
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+    
+    def enqueue(self, papers):
+        """批量加入 [(paper_url, title, task, listing_page, card)]，已在队列中的论文保持原状态"""
+        rows = [(paper_url, title, task, listing_page, json.dumps(card, ensure_ascii=False) if card else None,
+                 hash_point(paper_url), time.time()) for paper_url, title, task, listing_page, card in papers]
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                before = self.conn.total_changes
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO work_queue (paper_url, title, task, listing_page, card, ring_point, "
+                    "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                added = self.conn.total_changes - before
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return added
+    
+    def _range_clause(self, ranges):
+        if not ranges:
+            return "1", []
+        clause = ' OR '.join("(ring_point > ? AND ring_point <= ?)" for _ in ranges)
+        return f"({clause})", [bound for pair in ranges for bound in pair]
+    
+    def claim(self, worker, ranges=None, lease_seconds=LEASE_SECONDS):
+        """领取一篇待处理或租约已过期的论文，返回队列行；没有可领取的论文时返回 None"""
+        clause, params = self._range_clause(ranges)
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    f"SELECT * FROM work_queue WHERE {clause} AND (status = 'pending' OR "
+                    f"(status = 'leased' AND lease_expires < ?)) ORDER BY listing_page, rowid LIMIT 1",
+                    (*params, now)).fetchone()
+                if row is not None:
+                    self.conn.execute(
+                        "UPDATE work_queue SET status = 'leased', worker = ?, lease_expires = ?, "
+                        "attempts = attempts + 1, updated_at = ? WHERE paper_url = ?",
+                        (worker, now + lease_seconds, now, row['paper_url']))
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        if row is not None and row['status'] == 'leased':
+            print(f"    [INFO] Reclaimed expired lease of {row['worker']}: {row['title']}")
+        return row
+    
+    def complete(self, paper_url, worker, status, pdf_status=None, code_status=None):
+        """报告论文处理结果（done、failed 或 filtered）；租约已被其他工作者接手时不覆盖其状态"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE work_queue SET status = ?, lease_expires = NULL, pdf_status = ?, code_status = ?, "
+                "updated_at = ? WHERE paper_url = ? AND worker = ?",
+                (status, pdf_status, code_status, time.time(), paper_url, worker))
+    
+    def pending_count(self, ranges=None):
+        """区间内尚未完成（待处理或已被领取）的论文数"""
+        clause, params = self._range_clause(ranges)
+        with self.lock:
+            return self.conn.execute(
+                f"SELECT COUNT(*) FROM work_queue WHERE {clause} AND status IN ('pending', 'leased')",
+                params).fetchone()[0]
+    
+    def counts(self):
+        """各状态的论文数"""
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM work_queue GROUP BY status").fetchall())
+
+def enqueue_listing(session, work_queue, concurrency=DEFAULT_CONCURRENCY, base_urls=None, state=None):
+    """抓取列表页，把通过筛选的论文连同卡片信息加入共享工作队列，返回新加入的论文数"""
+    async def consume(base_url):
+        task = task_slug(base_url or BASE_URL)
+        added = 0
+        async for page_num, papers in iter_listing_pages(session, concurrency, base_url=base_url):
+            batch = [(card['paper_url'], card['title'], task, page_num, card) for card in papers
+                     if PAPER_FILTER.match_card(card, state, task)]
+            added += await asyncio.to_thread(work_queue.enqueue, batch)
+        return added
+    
+    async def run():
+        return sum(await asyncio.gather(*(consume(base_url) for base_url in base_urls or [BASE_URL])))
+    
+    added = asyncio.run(run())
+    print(f"\n  Enqueued {added} new papers, queue: {work_queue.counts()}")
+    return added
+
+def run_worker(session, work_queue, state, shard=0, shards=1, worker=None, lease_seconds=LEASE_SECONDS,
+               steal=False):
+    """分布式工作者：按一致性哈希领取本分片的论文并执行下载和克隆，结果写回共享队列
+    
+    本分片的论文处理完后，steal 为真时继续领取其他分片的论文（包括崩溃工作者过期的租约）；
+    否则在本分片还有其他工作者持有的租约时等待，直到租约完成或过期。
+    """
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    ranges = shard_ranges(shard, shards) if shards > 1 else None
+    print(f"\n  Worker {worker} serving shard {shard}/{shards}")
+    processed = 0
+    while True:
+        row = work_queue.claim(worker, ranges, lease_seconds)
+        if row is None and steal and ranges is not None:
+            row = work_queue.claim(worker, None, lease_seconds)
+        if row is None:
+            if work_queue.pending_count(None if steal else ranges) == 0:
+                break
+            time.sleep(QUEUE_POLL_INTERVAL)
+            continue
         
-        if page_num > 200:
-            print("\n  [WARN] Reached maximum page limit. Stopping.")
-            break
+        card = json.loads(row['card']) if row['card'] else None
+        paper_url = row['paper_url']
+        state.record_task(row['task'], paper_url)
+        if LINK_TASK_FOLDERS:
+            link_task_paper(row['task'], row['title'])
+        process_paper(session, row['title'], paper_url, state, row['listing_page'], card)
+        local = state.get(paper_url)
+        if state.is_complete(paper_url):
+            status = 'done'
+        elif (local is not None and local['resolved_at'] is not None
+              and not PAPER_FILTER.match_code(local['code_url'])):
+            # 解析出代码链接后才被 --has-code 筛除，不算失败
+            status = 'filtered'
+        else:
+            status = 'failed'
+        work_queue.complete(paper_url, worker, status, local['pdf_status'] if local else None,
+                            local['code_status'] if local else None)
+        processed += 1
+    print(f"\n  Worker {worker} finished {processed} papers, queue: {work_queue.counts()}")
+    return processed
+
+def print_manifest_stats(state):
+    """打印状态库中的抓取汇总，只读数据库，不访问下载目录"""
+    stats = state.stats()
+    print(f"Papers: {stats['papers']} ({stats['resolved']} resolved)")
+    print("PDF status: " + ', '.join(f"{k}={v}" for k, v in stats['pdf_status'].items()))
+    print("Code status: " + ', '.join(f"{k}={v}" for k, v in stats['code_status'].items()))
+    print(f"PDF bytes on disk: {stats['pdf_disk_bytes']} ({stats['pdf_disk_bytes'] / (1024 * 1024):.1f} MB, "
+          f"unique content)")
+    print(f"PDF bytes per paper: {stats['pdf_bytes']} ({stats['pdf_bytes'] / (1024 * 1024):.1f} MB, "
+          f"hard links counted for every paper)")
+    print(f"Code bytes: {stats['code_bytes']} ({stats['code_bytes'] / (1024 * 1024):.1f} MB)")
+    for name in ('avg_pdf_seconds', 'avg_code_seconds'):
+        if stats[name] is not None:
+            print(f"{name.replace('_', ' ').capitalize()}: {stats[name]:.2f}")
+    if stats['failures']:
+        print("Failures: " + ', '.join(f"{k}={v}" for k, v in stats['failures'].items()))
+    for task, count in stats['tasks'].items():
+        print(f"Task {task}: {count} papers")
+
+def print_manifest_query(state, where=None, columns=None, limit=None, as_json=False):
+    """按条件查询状态库中的论文清单，以制表符分隔或 JSON Lines 格式输出"""
+    names, rows = state.query(where, columns, limit)
+    if as_json:
+        for row in rows:
+            print(json.dumps(dict(zip(names, row)), ensure_ascii=False))
+        return
+    print('\t'.join(names))
+    for row in rows:
+        print('\t'.join('' if value is None else str(value) for value in row))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Download papers and code from Papers with Code")
+    parser.add_argument('--engine', choices=['serial', 'async', 'pipeline'], default='serial',
+                        help="serial: 原始逐页逐篇循环; async: 并发抓取列表页和详情页; "
+                             "pipeline: 列表/详情/PDF/克隆分阶段流水线")
+    parser.add_argument('--base-url', default=None, metavar='URL',
+                        help=f"任务列表页地址，默认为 {BASE_URL}")
+    parser.add_argument('--output-dir', default=None, metavar='DIR', help=f"下载目录，默认为 {BASE_DOWNLOAD_DIR}")
+    parser.add_argument('--tasks', nargs='+', default=None, metavar='SLUG',
+                        help="同时抓取多个任务（如 time-series-anomaly-detection object-detection），"
+                             "论文在所有任务间只下载一次，tasks/<任务名>/ 中是指向论文目录的链接")
+    parser.add_argument('--papers-dump', default=None, metavar='PATH',
+                        help="从 Papers with Code 导出的 papers-with-abstracts.json(.gz) 读取论文，代替抓取网页")
+    parser.add_argument('--links-dump', default=None, metavar='PATH',
+                        help="配合 --papers-dump 使用的 links-between-papers-and-code.json(.gz)")
+    parser.add_argument('--since', default=None, metavar='DATE',
+                        help="只保留在该日期（YYYY、YYYY-MM 或 YYYY-MM-DD）及之后发布的论文")
+    parser.add_argument('--until', default=None, metavar='DATE', help="只保留在该日期及之前发布的论文")
+    parser.add_argument('--min-stars', type=int, default=None, help="只保留代码仓库星标数不少于该值的论文")
+    parser.add_argument('--has-code', action='store_true', help="只保留有代码仓库的论文")
+    parser.add_argument('--title-regex', default=None, metavar='REGEX', help="只保留标题匹配该正则（不区分大小写）的论文")
+    parser.add_argument('--skip-other-tasks', action='store_true',
+                        help="跳过状态库中已属于其他任务的论文")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="async/pipeline 引擎下每个主机的最大并发请求数")
+    parser.add_argument('--prefetch', type=int, default=LISTING_PREFETCH,
+                        help="列表页预取窗口：确定最后一页后最多提前请求的列表页数")
+    parser.add_argument('--detail-workers', type=int, default=DETAIL_WORKERS, help="详情解析阶段的工作者数")
+    parser.add_argument('--pdf-workers', type=int, default=PDF_WORKERS, help="PDF下载阶段的工作者数")
+    parser.add_argument('--clone-workers', type=int, default=CLONE_WORKERS, help="同时运行的 git clone 进程数")
+    parser.add_argument('--clone-filter', default=None,
+                        help="部分克隆的 --filter 参数，例如 blob:none 或 blob:limit=1m；被过滤的大文件不会被检出")
+    parser.add_argument('--sparse', action='store_true', help="稀疏检出，只检出源码和文档文件")
+    parser.add_argument('--sparse-paths', nargs='+', default=None, help="自定义稀疏检出的路径模式")
+    parser.add_argument('--code-backend', choices=['git', 'tarball'], default='git',
+                        help="tarball: 下载默认分支的代码归档并直接解压（不含 git 历史），失败时回退到 git clone")
+    parser.add_argument('--codeload-url', default=CODELOAD_URL,
+                        help="代码归档的地址模板，{repo} 替换为 owner/name（用于本地测试或镜像）")
+    parser.add_argument('--git-mirrors', nargs='?', const='', default=None, metavar='DIR',
+                        help="启用共享的裸仓库镜像缓存，重复出现的仓库只从网络克隆一次，"
+                             "论文目录中的代码是镜像的 worktree；默认目录为下载目录下的 .mirrors")
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE, help="各阶段队列的最大长度")
+    parser.add_argument('--incremental', action='store_true',
+                        help="增量模式：使用条件请求，遇到状态库中已知的论文即停止")
+    parser.add_argument('--refresh', action='store_true',
+                        help="刷新模式：对状态库中已克隆的仓库并行执行 ls-remote，只拉取远端有更新的仓库")
+    parser.add_argument('--retry', action='store_true',
+                        help="只重试重试队列中已到重试时间的失败论文（指数退避），多次失败的论文进入死信列表")
+    parser.add_argument('--retry-dead', action='store_true', help="配合 --retry：同时重试死信列表中的论文")
+    parser.add_argument('--state-db', default=None,
+                        help=f"抓取状态数据库路径，默认为下载目录下的 {STATE_DB_NAME}")
+    parser.add_argument('--cache', action='store_true', help="启用列表页和详情页的磁盘响应缓存")
+    parser.add_argument('--cache-dir', default=None,
+                        help=f"响应缓存目录，默认为下载目录下的 {CACHE_DIR_NAME}")
+    parser.add_argument('--cache-max-mb', type=int, default=CACHE_MAX_BYTES // (1024 * 1024),
+                        help="响应缓存总大小上限（MB），超出时按LRU淘汰")
+    parser.add_argument('--offline', action='store_true', help="离线模式：只从响应缓存读取页面")
+    parser.add_argument('--download-connections', type=int, default=DOWNLOAD_CONNECTIONS_PER_HOST,
+                        help="PDF下载时每个主机的最大连接数")
+    parser.add_argument('--segments', type=int, default=DOWNLOAD_SEGMENTS,
+                        help="大文件分段下载的并发连接数，1 表示始终单连接下载")
+    parser.add_argument('--segment-threshold-mb', type=float, default=SEGMENTED_THRESHOLD / (1024 * 1024),
+                        help="超过该大小（MB）的文件分段下载")
+    parser.add_argument('--pdf-mirror', action='append', default=None, metavar='URL',
+                        help="arXiv PDF 的候选镜像（按顺序尝试），可重复使用，默认 arxiv.org 和 export.arxiv.org")
+    parser.add_argument('--hedge-delay', type=float, default=HEDGE_DELAY,
+                        help="PDF 请求在该秒数内没有响应时向下一个镜像发出对冲请求，0 表示只在失败时切换")
+    parser.add_argument('--object-store', default=None,
+                        help="内容寻址存储目录（需与下载目录在同一文件系统以使用硬链接），默认为下载目录下的 .objects")
+    parser.add_argument('--rate', action='append', default=[], metavar='HOST=RATE',
+                        help="设置主机的初始请求速率（次/秒），例如 --rate arxiv.org=1，可重复使用")
+    parser.add_argument('--no-rate-limit', action='store_true', help="关闭按主机的自适应限速")
+    parser.add_argument('--no-proxy', action='store_true', help="不使用代理访问 paperswithcode")
+    parser.add_argument('--metrics', default=None, metavar='PATH',
+                        help="定期写出各阶段耗时直方图、吞吐量、重试和错误计数；以 .prom 结尾时为 Prometheus 文本格式，否则为 JSON")
+    parser.add_argument('--metrics-interval', type=float, default=METRICS_INTERVAL, help="指标文件的写出间隔（秒）")
+    parser.add_argument('--enqueue', default=None, metavar='QUEUE_DB',
+                        help="分布式模式：抓取列表页并把论文加入共享工作队列（SQLite 文件，可位于共享文件系统）")
+    parser.add_argument('--worker', default=None, metavar='QUEUE_DB',
+                        help="分布式模式：作为工作者从共享工作队列领取论文并下载")
+    parser.add_argument('--shard', type=int, default=0, help="工作者负责的分片编号（0 到 --shards-1）")
+    parser.add_argument('--shards', type=int, default=1, help="分片总数，论文URL按一致性哈希分配到各分片")
+    parser.add_argument('--worker-id', default=None, help="工作者名称，默认为 主机名-进程号")
+    parser.add_argument('--lease-seconds', type=float, default=LEASE_SECONDS,
+                        help="领取论文的租约时长，超时未完成（工作者崩溃）的论文可被重新领取")
+    parser.add_argument('--steal', action='store_true', help="本分片完成后继续领取其他分片的论文")
+    parser.add_argument('--stats', action='store_true', help="打印状态库中的抓取汇总后退出，不发起任何请求")
+    parser.add_argument('--query', nargs='?', const='', default=None, metavar='WHERE',
+                        help="按 SQL 条件查询状态库中的论文清单后退出，例如 --query \"code_status = 'missing'\"")
+    parser.add_argument('--columns', default=None,
+                        help=f"--query 输出的列（逗号分隔），默认为 {','.join(CrawlState.QUERY_COLUMNS)}")
+    parser.add_argument('--limit', type=int, default=None, help="--query 最多输出的行数")
+    parser.add_argument('--json', action='store_true', help="--query 以 JSON Lines 格式输出")
+    args = parser.parse_args()
+    if args.papers_dump and args.min_stars is not None:
+        # 导出文件中没有星标数，按 0 判断会筛掉所有论文
+        parser.error("--min-stars cannot be used with --papers-dump: the dump files have no star counts")
+    return args
+
+if __name__ == '__main__':
+    args = parse_args()
+    BASE_URL = args.base_url or BASE_URL
+    BASE_DOWNLOAD_DIR = args.output_dir or BASE_DOWNLOAD_DIR
+    OBJECT_STORE_DIR = args.object_store
+    DOWNLOAD_SEGMENTS = max(1, args.segments)
+    SEGMENTED_THRESHOLD = int(args.segment_threshold_mb * 1024 * 1024)
+    if args.pdf_mirror:
+        ARXIV_MIRRORS = args.pdf_mirror
+    HEDGE_DELAY = args.hedge_delay
+    CLONE_FILTER = args.clone_filter
+    CLONE_SPARSE_PATHS = args.sparse_paths or (SOURCE_SPARSE_PATTERNS if args.sparse else None)
+    CODE_BACKEND = args.code_backend
+    CODELOAD_URL = args.codeload_url
+    USE_GIT_MIRRORS = args.git_mirrors is not None
+    GIT_MIRROR_DIR = args.git_mirrors or None
+    LINK_TASK_FOLDERS = bool(args.tasks)
+    LISTING_PREFETCH = max(1, args.prefetch)
+    PAPER_FILTER = PaperFilter(args.since, args.until, args.min_stars, args.has_code, args.title_regex,
+                               args.skip_other_tasks)
+    RATE_LIMITER.enabled = not args.no_rate_limit
+    for item in args.rate:
+        host, _, rate = item.partition('=')
+        RATE_LIMITER.rates[host] = float(rate)
+    base_urls = [TASK_URL_TEMPLATE.format(slug=slug) for slug in args.tasks] if args.tasks else [BASE_URL]
+    if args.stats or args.query is not None:
+        state = open_crawl_state(args.state_db, create=False)
+        if state is None:
+            print(f"[ERROR] State database not found: {args.state_db or os.path.join(BASE_DOWNLOAD_DIR, STATE_DB_NAME)}")
+            sys.exit(1)
+        try:
+            if args.stats:
+                print_manifest_stats(state)
+            if args.query is not None:
+                columns = args.columns.split(',') if args.columns else None
+                print_manifest_query(state, args.query, columns, args.limit, args.json)
+        except sqlite3.Error as e:
+            print(f"[ERROR] Query failed: {e}")
+            sys.exit(1)
+        finally:
+            state.close()
+        sys.exit(0)
+    os.makedirs(BASE_DOWNLOAD_DIR, exist_ok=True)
+    cache = None
+    if args.cache or args.offline:
+        cache = open_response_cache(args.cache_dir, args.cache_max_mb * 1024 * 1024, args.offline)
+    session = create_session(use_proxy=not args.no_proxy,
+                             pool_size=max(10, args.concurrency + args.detail_workers), cache=cache)
+    
+    state = open_crawl_state(args.state_db)
+    http = get_download_client(args.download_connections)
+    if args.metrics:
+        METRICS.start_flusher(args.metrics, args.metrics_interval)
+    
+    try:
+        if args.refresh:
+            stats = refresh_repositories(state, args.clone_workers)
+            print(f"\n  Refreshed {stats['repositories']} repositories: {stats['updated']} updated, "
+                  f"{stats['unchanged']} unchanged, {stats['failed']} failed")
+            total = stats['updated']
+        elif args.retry:
+            total = retry_failures(session, state, args.retry_dead)
+        elif args.enqueue:
+            work_queue = WorkQueue(args.enqueue)
+            try:
+                total = enqueue_listing(session, work_queue, args.concurrency, base_urls, state)
+            finally:
+                work_queue.close()
+        elif args.worker:
+            work_queue = WorkQueue(args.worker)
+            try:
+                total = run_worker(session, work_queue, state, args.shard, args.shards, args.worker_id,
+                                   args.lease_seconds, args.steal)
+            finally:
+                work_queue.close()
+        elif args.papers_dump:
+            task_slugs = args.tasks or [task_slug(BASE_URL)]
+            total = crawl_from_dump(args.papers_dump, args.links_dump, task_slugs, state, args.clone_workers)
+        elif args.incremental:
+            total = sum(crawl_incremental(session, state, base_url) for base_url in base_urls)
+        elif args.engine == 'async':
+            total = crawl_with_async_engine(session, args.concurrency, state, args.clone_workers, base_urls)
+        elif args.engine == 'pipeline':
+            total = crawl_with_pipeline(session, args, state, base_urls)
+        else:
+            total = sum(crawl_serial(session, state, base_url) for base_url in base_urls)
+        print(f"\n  Completed papers in crawl state: {state.completed_count()}")
+        stats = http.stats()
+        print(f"  Download connections: {stats['requests']} requests, {stats['new_connections']} new, "
+              f"{stats['reused_connections']} reused")
+        for host, (rate, throttled) in RATE_LIMITER.summary().items():
+            print(f"  Rate limit {host}: {rate} req/s, throttled {throttled} times")
+    finally:
+        state.close()
+        METRICS.stop_flusher()
+        summary = METRICS.summary()
+        if summary:
+            print("\n  Stage metrics:")
+            print(summary)
     
-    print(f"\n--- Script finished. Total unique papers processed: {len(processed_titles)} ---")
+    print(f"\n--- Script finished. Total unique papers processed: {total} ---")